@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+import argparse
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import tracemalloc
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from cache import PageCache
+from criteria import Criteria
+import merge
+from metrics import METRICS
+import toppreise
+from toppreise import Browser, CachedFetcher, HttpClient, Scraper
+from util import SPECS_DIR, parse_products
+
+FIXTURES_DIR = Path('data/fixtures')
+MANIFEST_FILE = 'manifest.json'
+BASELINE_FILE = 'baseline.json'
+TOPPREISE = 'https://www.toppreise.ch'
+
+# Stages in pipeline order, fetch and parse being part of the scrape
+STAGES = ['scrape', 'fetch', 'parse', 'filter parse', 'criteria', 'merge']
+
+
+def record(categories, max_products, fetcher, directory=FIXTURES_DIR):
+    # Scrape the first products of every category, recording every page fetched on the way
+    # in the page cache format, so that replaying the scrape requests the same pages
+    cache = PageCache(directory, ttl={'search': 0, 'product': 0}, max_size=float('inf'))
+    manifest = {}
+    with CachedFetcher(fetcher, cache) as recorder:
+        for category in categories:
+            print(f'=== {category} ===')
+            scraper = Scraper.from_yaml(SPECS_DIR / f'{category}.yaml', recorder)
+            scraper.scrape(max_products)
+            manifest[category] = max_products
+    with open(Path(directory) / MANIFEST_FILE, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+class StandInAdapter(HTTPAdapter):
+
+    def __init__(self, origin):
+        super().__init__()
+        self.origin = origin
+
+    def send(self, request, **kwargs):
+        request.url = self.origin + request.url[len(TOPPREISE):]
+        return super().send(request, **kwargs)
+
+
+class StandIn():
+    # Local HTTP server replaying the recorded pages in place of Toppreise
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.pages = {url: html.encode('utf-8') for url, html in PageCache(directory).entries()}
+        self.server = None
+
+    def __enter__(self):
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = pages.get(TOPPREISE + self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self):
+        # HTTP client sending the requests to Toppreise to the stand-in
+        client = HttpClient()
+        client.session.mount(TOPPREISE, StandInAdapter(f'http://127.0.0.1:{self.server.server_port}'))
+        return client
+
+
+@contextmanager
+def silenced(enabled=True):
+    # Hide the output of the pipeline, including the progress bars written to stderr
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        yield
+
+
+def measure(function, *args):
+    # Duration of a stage, and peak of the memory it allocated if tracing
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        allocated = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - allocated if tracemalloc.is_tracing() else None
+    return result, seconds, peak
+
+
+def run_pipeline(manifest, stand_in, directory):
+    # Scrape, filter and merge the recorded products, timing every stage of every category
+    complete_dir = Path(directory) / 'complete'
+    filtered_dir = Path(directory) / 'filtered'
+    complete_dir.mkdir(exist_ok=True)
+    filtered_dir.mkdir(exist_ok=True)
+    rows = []
+    with stand_in.client() as client:
+        for category, max_products in manifest.items():
+            METRICS.reset()
+            scraper = Scraper.from_yaml(SPECS_DIR / f'{category}.yaml', client)
+            products, seconds, peak = measure(scraper.scrape, max_products)
+            rows.append(('scrape', category, len(products), seconds, peak))
+            rows += [(stage.stage, category, stage.count, stage.seconds, None) for stage in METRICS.stages().itertuples()]
+            scraper.to_csv(complete_dir / f'{category}.csv')
+            scraper.offers_to_csv(complete_dir / f'{category}.offers.csv')
+
+            # Importing the product's module registers its parser
+            importlib.import_module(category)
+            df, seconds, peak = measure(parse_products, category, complete_dir)
+            rows.append(('filter parse', category, len(df), seconds, peak))
+            criteria = Criteria.from_yaml(SPECS_DIR / f'{category}.yaml')
+            filtered, seconds, peak = measure(lambda df: criteria.apply(df, log=False), df)
+            rows.append(('criteria', category, len(df), seconds, peak))
+            filtered.to_csv(filtered_dir / f'{category}.csv', index=False)
+
+    sheets, seconds, peak = measure(merge.merge, filtered_dir, Path(directory) / merge.BOOK)
+    rows.append(('merge', '', sum(len(df) for df in sheets.values()), seconds, peak))
+    return pd.DataFrame(rows, columns=['stage', 'category', 'items', 'seconds', 'peak'])
+
+
+def run(directory=FIXTURES_DIR, repeat=3, verbose=False):
+    with open(Path(directory) / MANIFEST_FILE, 'r') as file:
+        manifest = json.load(file)
+
+    # Time the fastest of the repeated runs, then measure memory in a separate run, as
+    # tracing allocations slows every stage down. Replayed pages do not change when fetched
+    # again, retries would only add randomly jittered delays
+    runs = []
+    attempts, toppreise.RETRY_ATTEMPTS = toppreise.RETRY_ATTEMPTS, 1
+    try:
+        with StandIn(directory) as stand_in:
+            for run_index in range(repeat + 1):
+                if run_index == repeat:
+                    tracemalloc.start()
+                with tempfile.TemporaryDirectory() as work_dir, silenced(not verbose):
+                    runs.append(run_pipeline(manifest, stand_in, work_dir))
+            tracemalloc.stop()
+    finally:
+        toppreise.RETRY_ATTEMPTS = attempts
+
+    timings = pd.concat(runs[:-1]).groupby(['stage', 'category'], as_index=False).agg(items=('items', 'first'), seconds=('seconds', 'min'))
+    memory = runs[-1].groupby(['stage', 'category'], as_index=False)['peak'].max()
+    df = timings.merge(memory, on=['stage', 'category'])
+
+    # Throughput over all categories, and the highest peak memory of any category
+    df = df.groupby('stage', as_index=False).agg(items=('items', 'sum'), seconds=('seconds', 'sum'), peak=('peak', 'max'))
+    df['items/s'] = df['items'] / df['seconds']
+    df['peak [MB]'] = df['peak'] / 1024 ** 2
+    return df.sort_values('stage', key=lambda stage: stage.map(STAGES.index)).drop(columns='peak').reset_index(drop=True)
+
+
+def compare(df, baseline, tolerance):
+    # Relative change of the throughput of every stage, stages slower by more than the tolerance regressed
+    df = df.merge(baseline[['stage', 'items/s']].rename(columns={'items/s': 'baseline items/s'}), on='stage', how='left')
+    df['change'] = df['items/s'] / df['baseline items/s'] - 1
+    return df, df[df['change'] < -tolerance]['stage'].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record Toppreise pages, and benchmark the pipeline on them offline')
+    parser.add_argument('--fixtures', type=str, default=str(FIXTURES_DIR), help='Directory of recorded pages')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='Record the pages of the first products of every category')
+    record_parser.add_argument('--products', type=int, default=50, help='Number of products to record per category')
+    record_parser.add_argument('--only', type=str, help='Comma-separated categories to record, e.g. cpu,ram')
+    record_parser.add_argument('--http', action='store_true', help='Fetch pages over plain HTTP, falling back to the browser')
+    run_parser = subparsers.add_parser('run', help='Replay the recorded pages through the pipeline, from a local HTTP server')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs, the fastest one is reported')
+    run_parser.add_argument('--save-baseline', action='store_true', help='Store the results as the baseline of later runs')
+    run_parser.add_argument('--tolerance', type=float, default=0.2, help='Relative throughput loss reported as a regression')
+    run_parser.add_argument('--verbose', action='store_true', help='Show the output of the pipeline')
+    args = parser.parse_args()
+
+    fixtures = Path(args.fixtures)
+    if args.command == 'record':
+        categories = args.only.split(',') if args.only else [spec.stem for spec in sorted(SPECS_DIR.glob('*.yaml'))]
+        fetcher = HttpClient(fallback=Browser()) if args.http else Browser()
+        record(categories, args.products, fetcher, fixtures)
+        return
+
+    df = run(fixtures, args.repeat, args.verbose)
+    baseline_path = fixtures / BASELINE_FILE
+    regressions = []
+    if baseline_path.exists() and not args.save_baseline:
+        df, regressions = compare(df, pd.read_json(baseline_path), args.tolerance)
+    print(df.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    if args.save_baseline:
+        df.to_json(baseline_path, orient='records', indent=2)
+        print(f'Saved baseline to {baseline_path}')
+    if regressions:
+        raise SystemExit(f'Throughput regressed by more than {args.tolerance:.0%} in: {", ".join(regressions)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import argparse
+import numpy as np
+import pandas as pd
+from paretoset import paretoset as reference_paretoset
+import time
+import pareto
+
+
+def synthetic_costs(size, objectives, seed=0):
+    # Anti-correlated objectives, like price vs. performance, give large fronts
+    rng = np.random.default_rng(seed)
+    quality = rng.random(size)
+    columns = {'price': 100 + 1000 * quality + 50 * rng.random(size)}
+    for i in range(objectives - 1):
+        columns[f'objective {i}'] = quality + 0.2 * rng.random(size)
+    columns['manufacturer'] = rng.choice(['AMD', 'Intel'], size)
+    return pd.DataFrame(columns), ['min'] + ['max'] * (objectives - 1) + ['diff']
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Pareto front engine against paretoset')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Number of rows')
+    parser.add_argument('--objectives', type=int, nargs='+', default=[2, 3, 4], help='Number of min/max objectives')
+    parser.add_argument('--no-reference', action='store_true', help='Do not run paretoset, e.g. on very large inputs')
+    args = parser.parse_args()
+
+    # Warm up paretoset, which may compile its algorithm on first use
+    if not args.no_reference:
+        df, sense = synthetic_costs(100, 2)
+        reference_paretoset(df, sense)
+
+    for objectives in args.objectives:
+        for size in args.sizes:
+            df, sense = synthetic_costs(size, objectives)
+            duration, mask = timed(pareto.paretoset, df, sense)
+            line = f'{objectives} objectives, {size} rows: front of {mask.sum()} rows in {duration:.3f} s'
+            if not args.no_reference:
+                reference_duration, reference_mask = timed(reference_paretoset, df, sense)
+                if not (mask == reference_mask).all():
+                    raise SystemExit(f'Front differs from paretoset on {size} rows with {objectives} objectives')
+                line += f', paretoset {reference_duration:.3f} s, speedup {reference_duration / duration:.1f}x'
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+import argparse
+from bs4 import BeautifulSoup
+import re
+import time
+from cache import CACHE_DIR, PageCache, page_type
+import toppreise
+
+
+# Reference implementation, parsing with BeautifulSoup's html.parser
+def legacy_parse_number_of_products(html):
+    soup = BeautifulSoup(html, "html.parser")
+    hits_string = soup.find('span', class_='f_hits').text
+    return int(re.match(r"^([\d']+) hits$", hits_string).group(1).replace("'", ""))
+
+
+def legacy_parse_product_links(html):
+    soup = BeautifulSoup(html, "html.parser")
+    matching_nodes = soup.find_all(id=re.compile(r"^Plugin_Product_.*"))
+    matching_nodes += soup.find_all(id=re.compile(r"^Plugin_Offer_.*"))
+    return ['https://www.toppreise.ch' + node.find_all('a')[0]['href'] for node in matching_nodes]
+
+
+def legacy_parse_product_features(html, product_url):
+    soup = BeautifulSoup(html, "html.parser")
+    price = float(soup.find('div', attrs={'class': "Plugin_Price"}).text.strip().replace("'", ""))
+    manufacturer = soup.find('span', class_="manu").text.strip()
+    title = soup.find('span', class_="title break")
+    if title is None:
+        title = soup.find('span', class_="title")
+    name = title.text.strip().split(',')[0]
+    features = {
+        'manufacturer': manufacturer,
+        'name': name,
+        'price': price,
+        'link': product_url
+    }
+    category_nodes = soup.find_all(id=re.compile(r"^Plugin_ProductNgfFeatureCategory_.*"))
+    for category_node in category_nodes:
+        category_name = category_node.find('div', class_='featureCatName').text.strip()
+        features[category_name] = {}
+        feature_nodes = category_node.find_all(id=re.compile(r"^Plugin_ProductNgfFeature_.*"))
+        for feature_node in feature_nodes:
+            key = feature_node.find('div', class_='name').text.strip()
+            value = feature_node.find('div', class_='value').text.strip()
+            features[category_name][key] = value
+    return features
+
+
+def parse_search_page(html):
+    return toppreise.parse_number_of_products(html), [toppreise.get_product_link(node) for node in toppreise.parse_product_list(html)]
+
+
+def legacy_parse_search_page(html):
+    return legacy_parse_number_of_products(html), legacy_parse_product_links(html)
+
+
+def load_fixtures(directory):
+    # Fixtures are stored in the page cache format
+    return list(PageCache(directory).entries())
+
+
+def benchmark(parse, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [parse(url, html) for url, html in pages]
+    return (time.perf_counter() - start) / repeat, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HTML parser against the BeautifulSoup reference')
+    parser.add_argument('fixtures', type=str, nargs='?', default=str(CACHE_DIR), help='Directory of recorded pages, in the page cache format')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to parse every page')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    search_pages = [(url, html) for url, html in fixtures if page_type(url) == 'search']
+    product_pages = [(url, html) for url, html in fixtures if page_type(url) == 'product']
+
+    stages = [
+        ('search', search_pages, lambda url, html: parse_search_page(html), lambda url, html: legacy_parse_search_page(html)),
+        ('product', product_pages, lambda url, html: toppreise.parse_product_features(html, url), lambda url, html: legacy_parse_product_features(html, url)),
+    ]
+    mismatches = 0
+    for name, pages, parse, legacy_parse in stages:
+        if not pages:
+            continue
+        duration, results = benchmark(parse, pages, args.repeat)
+        legacy_duration, legacy_results = benchmark(legacy_parse, pages, args.repeat)
+
+        # Check output did not change
+        for (url, _), result, legacy_result in zip(pages, results, legacy_results):
+            if result != legacy_result:
+                print(f'Output mismatch on {url}')
+                mismatches += 1
+
+        print(f'{name}: {len(pages)} pages, {1000 * legacy_duration / len(pages):.2f} ms/page (html.parser), '
+              f'{1000 * duration / len(pages):.2f} ms/page (lxml), speedup {legacy_duration / duration:.1f}x')
+
+    if mismatches:
+        raise SystemExit(f'{mismatches} pages parsed differently')
+
+
+if __name__ == "__main__":
+    main()
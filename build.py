@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import argparse
+import heapq
+from pathlib import Path
+import pandas as pd
+from pareto import pareto_layers
+
+DATA_DIR = Path('data/filtered')
+BUILDS_FILE = Path('data/builds.csv')
+
+# Order in which parts are chosen, every part is checked against the parts chosen before
+CATEGORIES = ['cpu', 'mobo', 'ram', 'ssd', 'hdd', 'psu']
+
+# Objective weights, applied to each column normalized by its maximum
+DEFAULT_OBJECTIVE = {
+    'cpu': {'performance': 1},
+    'ram': {'total capacity': 0.25},
+    'ssd': {'total capacity': 0.25},
+    'hdd': {'total capacity': 0.1},
+}
+
+# Columns relevant for compatibility, which must survive the Pareto pruning
+PRUNING_OBJECTIVES = {
+    'cpu': {'socket': 'diff'},
+    'mobo': {'socket': 'diff', 'type': 'diff', 'number of slots': 'max', 'M.2': 'max', 'SATA 6Gb/s': 'max'},
+    'ram': {'ddr': 'diff', 'number of modules': 'min'},
+    'psu': {'power': 'max'},
+}
+
+
+def load_parts(counts, directory=DATA_DIR, in_stock=False):
+    parts = {category: pd.read_csv(Path(directory) / f'{category}.csv')
+             for category in CATEGORIES if counts.get(category, 1) > 0}
+    # Parts scraped without offers are kept, whether they are in stock is unknown
+    if in_stock:
+        parts = {category: df[df['in stock']] if 'in stock' in df else df for category, df in parts.items()}
+    return parts
+
+
+def score_parts(parts, objective, counts):
+    # Price and score of the parts, multiplied by the number of parts in the build
+    for category, df in parts.items():
+        score = pd.Series(0.0, index=df.index)
+        for column, weight in objective.get(category, {}).items():
+            if df[column].max() > 0:
+                score += weight * df[column] / df[column].max()
+        df['score'] = counts.get(category, 1) * score
+        df['total price'] = counts.get(category, 1) * df['price']
+    return parts
+
+
+def prune_parts(parts, top, log=True):
+    # A part dominated in price, score and compatibility by parts of the first top Pareto layers
+    # can always be replaced by any of these, so it cannot be in the top builds
+    pruned = {}
+    for category, df in parts.items():
+        objectives = {'total price': 'min', 'score': 'max'}
+        objectives.update({column: sense for column, sense in PRUNING_OBJECTIVES.get(category, {}).items() if column in df})
+        mask = pareto_layers(df[list(objectives)], list(objectives.values()), top) >= 0
+        pruned[category] = df[mask].sort_values('total price')
+        if log:
+            print(f'Kept {mask.sum()}/{len(df)} {category} candidates.')
+    return pruned
+
+
+def is_compatible(category, part, build, counts, min_power):
+    if category == 'mobo' and 'cpu' in build:
+        return build['cpu']['socket'] == part['socket']
+    if category == 'ram' and 'mobo' in build:
+        mobo = build['mobo']
+        return part['ddr'] in mobo['type'] and part['number of modules'] <= mobo['number of slots']
+    if category == 'ssd' and 'mobo' in build:
+        return counts['ssd'] <= build['mobo']['M.2']
+    if category == 'hdd' and 'mobo' in build:
+        return counts['hdd'] <= build['mobo']['SATA 6Gb/s']
+    if category == 'psu':
+        return part['power'] >= min_power
+    return True
+
+
+def search(parts, budget, counts, min_power=0, top=10):
+    categories = [category for category in CATEGORIES if category in parts]
+    candidates = [parts[category].to_dict('records') for category in categories]
+    if not all(candidates):
+        return []
+
+    # Bounds on the price and score of the parts still to be chosen, ignoring compatibility
+    min_price = [0.0] * (len(categories) + 1)
+    max_score = [0.0] * (len(categories) + 1)
+    for level in reversed(range(len(categories))):
+        min_price[level] = min_price[level + 1] + min(part['total price'] for part in candidates[level])
+        max_score[level] = max_score[level + 1] + max(part['score'] for part in candidates[level])
+
+    # Min-heap of the best builds found so far
+    best = []
+    counter = 0
+
+    def branch(level, build, price, score):
+        nonlocal counter
+        if level == len(categories):
+            counter += 1
+            entry = (score, -price, counter, dict(build))
+            if len(best) < top:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+            return
+
+        # Candidates are sorted by price, stop at the first one exceeding the budget
+        category = categories[level]
+        for part in candidates[level]:
+            if price + part['total price'] + min_price[level + 1] > budget:
+                break
+            # Bound the best score reachable from here
+            if len(best) == top and score + part['score'] + max_score[level + 1] < best[0][0]:
+                continue
+            if not is_compatible(category, part, build, counts, min_power):
+                continue
+            build[category] = part
+            branch(level + 1, build, price + part['total price'], score + part['score'])
+            del build[category]
+
+    branch(0, {}, 0.0, 0.0)
+    return [(score, -price, build) for score, price, _, build in sorted(best, reverse=True)]
+
+
+def builds_to_dataframe(builds, counts):
+    rows = []
+    for score, price, build in builds:
+        row = {'score': score, 'price': price}
+        for category, part in build.items():
+            count = counts.get(category, 1)
+            row[category] = f'{count}x {part["name"]}' if count > 1 else part['name']
+            row[f'{category} price'] = part['price']
+            if 'merchant' in part:
+                row[f'{category} merchant'] = part['merchant']
+            row[f'{category} link'] = part['link']
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the best compatible builds within a budget')
+    parser.add_argument('--budget', type=float, default=2000, help='Maximum total price')
+    parser.add_argument('--top', type=int, default=10, help='Number of builds to return')
+    parser.add_argument('--ssds', type=int, default=1, help='Number of SSDs')
+    parser.add_argument('--hdds', type=int, default=0, help='Number of HDDs')
+    parser.add_argument('--min-power', type=float, default=650, help='Minimum PSU power, in W')
+    parser.add_argument('--in-stock', action='store_true', help='Only choose parts offered in stock by a merchant')
+    parser.add_argument('--output', type=str, default=str(BUILDS_FILE), help='Output file path')
+    args = parser.parse_args()
+
+    counts = {'ssd': args.ssds, 'hdd': args.hdds}
+    parts = load_parts(counts, in_stock=args.in_stock)
+    parts = score_parts(parts, DEFAULT_OBJECTIVE, counts)
+    parts = prune_parts(parts, args.top)
+    builds = search(parts, args.budget, counts, args.min_power, args.top)
+
+    categories = [category for category in CATEGORIES if category in parts]
+    if not builds:
+        # Nothing fits the budget, or a category has no candidates left after filtering
+        print(f'No feasible build within a budget of {args.budget:g}')
+        columns = ['score', 'price']
+        for category in categories:
+            columns += [category, f'{category} price']
+            if 'merchant' in parts[category]:
+                columns.append(f'{category} merchant')
+            columns.append(f'{category} link')
+        pd.DataFrame(columns=columns).to_csv(args.output, index=False)
+        return
+
+    df = builds_to_dataframe(builds, counts)
+    print(df[['score', 'price'] + categories].to_string(index=False))
+    df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+
+CACHE_DIR = Path('data/cache')
+
+# Default time-to-live of cached pages, in seconds, per page type
+DEFAULT_TTL = {
+    'search': 60 * 60,
+    'product': 7 * 24 * 60 * 60,
+}
+
+
+def page_type(url):
+    if url.startswith('https://www.toppreise.ch/price-comparison'):
+        return 'product'
+    else:
+        return 'search'
+
+
+class PageCache():
+
+    def __init__(self, directory=CACHE_DIR, ttl=None, max_size=1024 ** 3):
+        self.directory = Path(directory)
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.max_size = max_size
+        # Total size of cached pages, computed on first write
+        self.size = None
+
+    def paths(self, url):
+        # Entries are addressed by the hash of their URL, and spread over subdirectories
+        key = hashlib.sha256(url.encode()).hexdigest()
+        subdir = self.directory / key[:2]
+        return subdir / f'{key}.html.gz', subdir / f'{key}.json'
+
+    def load(self, url):
+        html_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            with gzip.open(html_path, 'rt', encoding='utf-8') as file:
+                html = file.read()
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None
+        # Record the access for LRU eviction
+        os.utime(html_path)
+        return html, meta
+
+    def is_fresh(self, url, meta):
+        return time.time() - meta['fetched_at'] < self.ttl[page_type(url)]
+
+    def get(self, url, stale=False):
+        entry = self.load(url)
+        if entry is None:
+            return None
+        html, meta = entry
+        if stale or self.is_fresh(url, meta):
+            return html
+        return None
+
+    def put(self, url, html, etag=None, last_modified=None):
+        html_path, meta_path = self.paths(url)
+        html_path.parent.mkdir(exist_ok=True, parents=True)
+        if self.size is None:
+            self.size = sum(path.stat().st_size for path in self.directory.glob('*/*.html.gz'))
+        if html_path.exists():
+            self.size -= html_path.stat().st_size
+        with gzip.open(html_path, 'wt', encoding='utf-8') as file:
+            file.write(html)
+        meta = {'url': url, 'fetched_at': time.time(), 'etag': etag, 'last_modified': last_modified}
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+        self.size += html_path.stat().st_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        # URL and content of every cached page
+        for meta_path in sorted(self.directory.glob('*/*.json')):
+            with open(meta_path, 'r') as file:
+                url = json.load(file)['url']
+            entry = self.load(url)
+            if entry is not None:
+                yield url, entry[0]
+
+    def touch(self, url):
+        # Mark an entry as fresh again, after the server confirmed it did not change
+        entry = self.load(url)
+        if entry is not None:
+            html, meta = entry
+            self.put(url, html, meta['etag'], meta['last_modified'])
+
+    def evict(self):
+        entries = [(path.stat(), path) for path in self.directory.glob('*/*.html.gz')]
+        total_size = sum(stat.st_size for stat, _ in entries)
+
+        # Remove least recently used entries until we are within the size limit
+        entries.sort(key=lambda entry: entry[0].st_mtime)
+        for stat, html_path in entries:
+            if total_size <= self.max_size:
+                break
+            html_path.unlink(missing_ok=True)
+            html_path.with_name(html_path.name.replace('.html.gz', '.json')).unlink(missing_ok=True)
+            total_size -= stat.st_size
+        self.size = total_size
@@ -0,0 +1,84 @@
+import pandas as pd
+import yaml
+from pareto import paretoset
+
+# Sections of a spec describing how to select products, applied in this order
+SECTIONS = ['derived', 'filters', 'objectives', 'front filters', 'sort']
+
+
+def log_removed(name, original_size, filtered_size):
+    print(f'Removed {original_size - filtered_size}/{original_size} entries by {name} filter.')
+
+
+def combined_mask(df, filters, log=True):
+    # Evaluate all rules on the same data and combine them into a single mask,
+    # logging the entries removed by every rule in turn
+    mask = pd.Series(True, index=df.index)
+    for name, expression in filters.items():
+        size = mask.sum()
+        mask &= df.eval(expression).astype(bool)
+        if log:
+            log_removed(name, size, mask.sum())
+    return mask
+
+
+class Criteria():
+
+    def __init__(self, derived=None, filters=None, objectives=None, front_filters=None, sort=None):
+        self.derived = dict(derived or {})
+        self.filters = dict(filters or {})
+        self.objectives = dict(objectives or {})
+        self.front_filters = dict(front_filters or {})
+        self.sort = dict(sort or {})
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec.get('derived'), spec.get('filters'), spec.get('objectives'),
+                   spec.get('front filters'), spec.get('sort'))
+
+    @classmethod
+    def from_yaml(cls, path):
+        with open(path, 'r') as file:
+            return cls.from_dict(yaml.safe_load(file))
+
+    def update(self, spec):
+        # Alternative criteria, overriding single rules of the sections in the given
+        # dictionary, a rule set to None is removed
+        sections = {
+            'derived': self.derived,
+            'filters': self.filters,
+            'objectives': self.objectives,
+            'front filters': self.front_filters,
+            'sort': self.sort,
+        }
+        updated = {}
+        for section, rules in sections.items():
+            rules = dict(rules)
+            if section == 'sort' and spec.get('sort') is not None:
+                rules = {}
+            rules.update(spec.get(section) or {})
+            updated[section] = {name: rule for name, rule in rules.items() if rule is not None}
+        return Criteria.from_dict(updated)
+
+    def add_derived(self, df):
+        # Later derived columns may refer to earlier ones
+        for name, expression in self.derived.items():
+            df[name] = df.eval(expression)
+        return df
+
+    def apply(self, df, log=True):
+        # The parsed data is not modified, so it can be shared by several criteria
+        df = self.add_derived(df.copy())
+        df = df[combined_mask(df, self.filters, log)]
+
+        # Find Pareto front
+        if self.objectives:
+            mask = paretoset(df[list(self.objectives)], sense=list(self.objectives.values()))
+            if log:
+                log_removed('Pareto front', len(df), mask.sum())
+            df = df[mask]
+
+        df = df[combined_mask(df, self.front_filters, log)]
+        if self.sort:
+            df = df.sort_values(self.sort['by'], ascending=self.sort.get('ascending', True))
+        return df
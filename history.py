@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+from pathlib import Path
+import sqlite3
+import pandas as pd
+from toppreise import load_previous_products
+
+HISTORY_FILE = Path('data/history.sqlite')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    link TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    manufacturer TEXT,
+    name TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    link TEXT NOT NULL,
+    scraped_at TEXT NOT NULL,
+    price REAL NOT NULL,
+    features TEXT NOT NULL,
+    PRIMARY KEY (link, scraped_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS prices_scraped_at ON prices (scraped_at);
+CREATE TABLE IF NOT EXISTS snapshots (
+    category TEXT NOT NULL,
+    scraped_at TEXT NOT NULL,
+    products INTEGER NOT NULL,
+    changed INTEGER NOT NULL,
+    PRIMARY KEY (category, scraped_at)
+);
+'''
+
+# Aggregate of the prices of a product in the time window, and of the price it had when the window started
+WINDOW_PRICE = '''(
+    SELECT {aggregate}(price) FROM (
+        SELECT price FROM prices WHERE prices.link = products.link AND scraped_at >= :start
+        UNION ALL
+        SELECT * FROM (
+            SELECT price FROM prices WHERE prices.link = products.link AND scraped_at < :start
+            ORDER BY scraped_at DESC LIMIT 1
+        )
+    )
+)'''
+
+
+def timestamp(time=None):
+    # ISO 8601 UTC timestamps, which sort chronologically as strings
+    time = time or datetime.now(timezone.utc)
+    return time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class PriceHistory():
+
+    def __init__(self, path=HISTORY_FILE):
+        Path(path).parent.mkdir(exist_ok=True, parents=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sql, parameters=()):
+        return pd.read_sql_query(sql, self.connection, params=parameters)
+
+    def latest(self, links):
+        # Latest recorded price and features of the given products
+        latest = {}
+        cursor = self.connection.cursor()
+        for link in links:
+            row = cursor.execute('SELECT price, features FROM prices WHERE link = ? ORDER BY scraped_at DESC LIMIT 1', (link,)).fetchone()
+            if row is not None:
+                latest[link] = row
+        return latest
+
+    def record(self, category, df, scraped_at=None):
+        # Append a snapshot, only storing the products which are new or changed since
+        # their latest snapshot
+        scraped_at = scraped_at or timestamp()
+        df = df.drop_duplicates('link')
+        columns = [column for column in df.columns if column not in ('link', 'price')]
+        features = [json.dumps(row, sort_keys=True) for row in df[columns].fillna('').astype(str).to_dict('records')]
+        latest = self.latest(df['link'])
+        rows = [(link, scraped_at, float(price), row_features)
+                for link, price, row_features in zip(df['link'], df['price'], features)
+                if latest.get(link) != (float(price), row_features)]
+
+        manufacturers = df['manufacturer'] if 'manufacturer' in df else [None] * len(df)
+        names = df['name'] if 'name' in df else [None] * len(df)
+        with self.connection:
+            self.connection.executemany('''
+                INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (link) DO UPDATE SET manufacturer = excluded.manufacturer, name = excluded.name,
+                    last_seen = max(last_seen, excluded.last_seen)
+            ''', [(link, category, manufacturer, name, scraped_at, scraped_at)
+                  for link, manufacturer, name in zip(df['link'], manufacturers, names)])
+            self.connection.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?)', rows)
+            self.connection.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)', (category, scraped_at, len(df), len(rows)))
+        return len(rows)
+
+    def trajectory(self, link):
+        return self.query('SELECT scraped_at, price FROM prices WHERE link = ? ORDER BY scraped_at', (link,))
+
+    def lowest_prices(self, days=30, now=None):
+        # Lowest price of every product in the time window, including the price it had
+        # when the window started, looked up product by product on the primary key
+        start = timestamp((now or datetime.now(timezone.utc)) - timedelta(days=days))
+        return self.query(f'''
+            SELECT link, category, manufacturer, name, {WINDOW_PRICE.format(aggregate='MIN')} AS "lowest price"
+            FROM products
+        ''', {'start': start})
+
+    def price_drops(self, threshold=0.1, days=30, now=None):
+        # Products still listed in the latest snapshot of their category, whose price
+        # dropped by more than the threshold from its highest value in the time window
+        start = timestamp((now or datetime.now(timezone.utc)) - timedelta(days=days))
+        return self.query(f'''
+            SELECT *, 1 - price / "highest price" AS "drop" FROM (
+                SELECT link, category, manufacturer, name,
+                    {WINDOW_PRICE.format(aggregate='MAX')} AS "highest price",
+                    (SELECT price FROM prices WHERE prices.link = products.link ORDER BY scraped_at DESC LIMIT 1) AS price
+                FROM products
+                WHERE last_seen = (SELECT MAX(scraped_at) FROM snapshots WHERE snapshots.category = products.category)
+            )
+            WHERE price < (1 - :threshold) * "highest price"
+            ORDER BY "drop" DESC
+        ''', {'start': start, 'threshold': threshold})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and query the price history of scraped products')
+    parser.add_argument('--history', type=str, default=str(HISTORY_FILE), help='History database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='Record scraped CSV files, e.g. data/complete/cpu.csv, as snapshots')
+    record_parser.add_argument('files', type=str, nargs='+', help='CSV files, named after their category')
+    trajectory_parser = subparsers.add_parser('trajectory', help='Price trajectory of a product')
+    trajectory_parser.add_argument('link', type=str, help='Link of the product')
+    lowest_parser = subparsers.add_parser('lowest', help='Lowest price of every product in the last days')
+    lowest_parser.add_argument('--days', type=float, default=30, help='Length of the time window, in days')
+    drops_parser = subparsers.add_parser('drops', help='Products whose price dropped in the last days')
+    drops_parser.add_argument('--days', type=float, default=30, help='Length of the time window, in days')
+    drops_parser.add_argument('--threshold', type=float, default=0.1, help='Minimum relative price drop')
+    args = parser.parse_args()
+
+    with PriceHistory(args.history) as history:
+        if args.command == 'record':
+            # Snapshots are dated by the modification time of the files
+            for file in map(Path, args.files):
+                scraped_at = timestamp(datetime.fromtimestamp(file.stat().st_mtime, timezone.utc))
+                products = pd.DataFrame(load_previous_products(file).values())
+                changed = history.record(file.stem, products, scraped_at)
+                print(f'{file.stem}: recorded {changed} new or changed products')
+        elif args.command == 'trajectory':
+            print(history.trajectory(args.link).to_string(index=False))
+        elif args.command == 'lowest':
+            print(history.lowest_prices(args.days).to_string(index=False))
+        elif args.command == 'drops':
+            print(history.price_drops(args.threshold, args.days).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,293 @@
 #!/usr/bin/env python
+import argparse
+import hashlib
+from lxml import etree
+import os
 from pathlib import Path
+import re
+from xml.sax.saxutils import escape
+from zipfile import BadZipFile, ZipFile, ZIP_DEFLATED
 import pandas as pd
 from openpyxl import load_workbook, Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.packaging.custom import CustomPropertyList, StringProperty
+from openpyxl.utils import get_column_letter
+from openpyxl.xml.constants import (ARC_CONTENT_TYPES, ARC_CUSTOM, ARC_SHARED_STRINGS, ARC_WORKBOOK, ARC_WORKBOOK_RELS,
+                                    REL_NS, SHEET_MAIN_NS)
+from openpyxl.xml.functions import fromstring, tostring
+from toppreise import product_id
 
 DATA_DIR = Path('data/filtered')
 BOOK = 'bom.xlsx'
 
-# Open or create workbook
-if Path(BOOK).exists():
-    book = load_workbook(BOOK)
-else:
-    book = Workbook()
-    # Remove the default sheet created by openpyxl
-    default_sheet = book.active
-    book.remove(default_sheet)
-
-# Process CSVs and edit "link" column
-for csv_file in DATA_DIR.iterdir():
-    if csv_file.suffix == '.csv':  # Ensure only CSV files are processed
+# Cached formula dependencies, which spreadsheet editors rebuild if missing
+ARC_CALC_CHAIN = 'xl/calcChain.xml'
+calc_chain_regex = re.compile(rb'<(Override|Relationship)\b[^>]*calcChain\.xml"[^>]*/>')
+cell_reference_regex = re.compile(r'^([A-Z]+)(\d+)$')
+hyperlink_regex = re.compile(r'^=?HYPERLINK\("([^"]*)"')
+
+# Worksheet elements
+ROW_TAG = f'{{{SHEET_MAIN_NS}}}row'
+CELL_TAG = f'{{{SHEET_MAIN_NS}}}c'
+VALUE_TAG = f'{{{SHEET_MAIN_NS}}}v'
+FORMULA_TAG = f'{{{SHEET_MAIN_NS}}}f'
+INLINE_STRING_TAG = f'{{{SHEET_MAIN_NS}}}is'
+CALC_PROPERTIES_TAG = f'{{{SHEET_MAIN_NS}}}calcPr'
+# Elements of the workbook which precede the calculation properties
+CALC_PROPERTIES_PRECEDING = [f'{{{SHEET_MAIN_NS}}}{name}' for name in ('sheets', 'functionGroups', 'externalReferences', 'definedNames')]
+
+
+def file_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def hash_property(sheet_name):
+    return f'{sheet_name} source hash'
+
+
+def set_property(properties, name, value):
+    if name in properties.names:
+        del properties[name]
+    properties.append(StringProperty(name=name, value=value))
+
+
+def sheet_parts(book):
+    # Archive path of every sheet of an open workbook archive, by name
+    targets = {rel.get('Id'): rel.get('Target') for rel in fromstring(book.read(ARC_WORKBOOK_RELS))}
+    parts = {}
+    for sheet in fromstring(book.read(ARC_WORKBOOK)).iter(f'{{{SHEET_MAIN_NS}}}sheet'):
+        target = targets[sheet.get(f'{{{REL_NS}}}id')]
+        parts[sheet.get('name')] = target[1:] if target.startswith('/') else f'xl/{target}'
+    return parts
+
+
+def read_cell(cell, shared_strings):
+    # Value of a cell element, from its first value or inline string element, or its formula
+    # if it has no cached value
+    kind = cell.get('t')
+    formula = None
+    for child in cell:
+        if child.tag == FORMULA_TAG:
+            formula = '=' + (child.text or '')
+            continue
+        if child.tag == INLINE_STRING_TAG:
+            return ''.join(child.itertext())
+        if child.tag != VALUE_TAG:
+            continue
+        if kind == 's':
+            return shared_strings[int(child.text)]
+        if kind in ('str', 'e', 'inlineStr'):
+            return child.text
+        if kind == 'b':
+            return child.text == '1'
+        return float(child.text)
+    return formula
+
+
+def read_columns(book, part, headers):
+    # Values of the columns with the given headers in the first row of a sheet of an open
+    # workbook archive, by row
+    shared_strings = []
+    if ARC_SHARED_STRINGS in book.namelist():
+        root = etree.fromstring(book.read(ARC_SHARED_STRINGS))
+        shared_strings = [''.join(item.itertext()) for item in root.iter(f'{{{SHEET_MAIN_NS}}}si')]
+    letters = {}
+    columns = {}
+    for row in etree.fromstring(book.read(part)).iter(ROW_TAG):
+        for cell in row.iter(CELL_TAG):
+            match = cell_reference_regex.match(cell.get('r', ''))
+            if match is None:
+                continue
+            letter, row_number = match.group(1), int(match.group(2))
+            if row_number == 1:
+                value = read_cell(cell, shared_strings)
+                if value in headers:
+                    letters[letter] = value
+                    columns[value] = {}
+            elif letter in letters:
+                columns[letters[letter]][row_number] = read_cell(cell, shared_strings)
+    return columns
+
+
+def link_id(cell):
+    # Product ID of a link cell, a HYPERLINK formula or the link itself
+    if not isinstance(cell, str) or not cell:
+        return None
+    match = hyperlink_regex.match(cell)
+    return product_id(match.group(1) if match else cell)
+
+
+def read_book(path):
+    # Archive path of every sheet, and hashes of the CSV files the product sheets were
+    # written from, without loading the workbook
+    try:
+        with ZipFile(path) as book:
+            parts = sheet_parts(book)
+            if ARC_CUSTOM not in book.namelist():
+                return parts, None
+            properties = CustomPropertyList.from_tree(fromstring(book.read(ARC_CUSTOM)))
+    except (FileNotFoundError, BadZipFile):
+        return {}, None
+    return parts, {prop.name: prop.value for prop in properties.props
+                   if any(prop.name == hash_property(sheet_name) for sheet_name in parts)}
+
+
+def previous_ids(path, part):
+    # IDs of the products of the previous merge, in row order, from the ID column, or from
+    # the links of sheets merged before products had an ID
+    with ZipFile(path) as book:
+        columns = read_columns(book, part, ('id', 'link'))
+    if 'id' in columns:
+        ids = columns['id']
+    elif 'link' in columns:
+        ids = {row: link_id(cell) for row, cell in columns['link'].items()}
+    else:
+        return None
+    return [ids.get(row) for row in range(2, max(ids, default=1) + 1)]
+
+
+def arrange_rows(df, previous):
+    # Products keep the row they had in the previous merge and new products are appended,
+    # the rows of removed products are cleared but for their ID
+    previous = list(previous)
+    known = set(previous)
+    ids = previous + [product for product in df['id'] if product not in known]
+    return df.convert_dtypes().set_index('id').reindex(ids).reset_index()[list(df.columns)]
+
+
+def dataframe_rows(df):
+    # Header and rows as plain Python values, converting missing values in bulk
+    yield list(df.columns)
+    yield from df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def cell_xml(reference, value):
+    # Strings starting with "=" are formulas, as in openpyxl
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if not isinstance(value, str):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    if value.startswith('='):
+        return f'<c r="{reference}"><f>{escape(value[1:])}</f></c>'
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+def sheet_xml(df):
+    # Worksheet part, streamed row by row, with inline strings so that the shared
+    # strings of the other sheets are left untouched
+    letters = [get_column_letter(i + 1) for i in range(len(df.columns))]
+    yield f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{SHEET_MAIN_NS}">'
+    yield f'<dimension ref="A1:{letters[-1] if letters else "A"}{len(df) + 1}"/><sheetData>'
+    for row, values in enumerate(dataframe_rows(df), 1):
+        cells = ''.join(cell_xml(f'{letter}{row}', value) for letter, value in zip(letters, values))
+        yield f'<row r="{row}">{cells}</row>'
+    yield '</sheetData></worksheet>'
+
+
+def add_sheets(path, sheet_names, hashes):
+    # Create the missing sheets, and the properties holding the hashes, their content
+    # being written by patch_book
+    if Path(path).exists():
+        book = load_workbook(path)
+    else:
+        book = Workbook()
+        # Remove the default sheet created by openpyxl
+        book.remove(book.active)
+    for sheet_name in sheet_names:
+        if sheet_name not in book.sheetnames:
+            book.create_sheet(title=sheet_name)
+    for sheet_name in hashes:
+        set_property(book.custom_doc_props, hash_property(sheet_name), '')
+    book.save(path)
+
+
+def full_calc_on_load(xml):
+    # Recalculate all formulas when the workbook is opened, as the values cached in the manually
+    # created sheets still refer to the previous product sheets
+    root = etree.fromstring(xml)
+    calc_properties = root.find(CALC_PROPERTIES_TAG)
+    if calc_properties is None:
+        preceding = [child for child in root if child.tag in CALC_PROPERTIES_PRECEDING]
+        calc_properties = etree.Element(CALC_PROPERTIES_TAG)
+        preceding[-1].addnext(calc_properties)
+    calc_properties.set('fullCalcOnLoad', '1')
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def patch_book(path, sheets, hashes):
+    # Rewrite the changed sheets in a copy of the workbook archive, copying all other
+    # parts, e.g. the manually created sheets, as they are
+    temporary = Path(path).with_suffix('.tmp')
+    with ZipFile(path) as book:
+        parts = {part: sheet_name for sheet_name, part in sheet_parts(book).items() if sheet_name in sheets}
+        properties = CustomPropertyList.from_tree(fromstring(book.read(ARC_CUSTOM)))
+        for sheet_name, digest in hashes.items():
+            set_property(properties, hash_property(sheet_name), digest)
+        with ZipFile(temporary, 'w', ZIP_DEFLATED) as patched:
+            for info in book.infolist():
+                if info.filename == ARC_CALC_CHAIN:
+                    continue
+                if info.filename in parts:
+                    with patched.open(info.filename, 'w') as file:
+                        for chunk in sheet_xml(sheets[parts[info.filename]]):
+                            file.write(chunk.encode('utf-8'))
+                elif info.filename == ARC_CUSTOM:
+                    patched.writestr(info, tostring(properties.to_tree()))
+                elif info.filename == ARC_WORKBOOK:
+                    patched.writestr(info, full_calc_on_load(book.read(info)))
+                elif info.filename in (ARC_CONTENT_TYPES, ARC_WORKBOOK_RELS):
+                    patched.writestr(info, calc_chain_regex.sub(b'', book.read(info)))
+                else:
+                    patched.writestr(info, book.read(info))
+    os.replace(temporary, path)
+
+
+def merge(data_dir=DATA_DIR, book=BOOK, rebuild=False):
+    # Only product sheets whose CSV file changed since the last merge are rewritten
+    parts, hashes = read_book(book)
+    sheets = {}
+    changed = {}
+    for csv_file in sorted(Path(data_dir).iterdir()):
+        if csv_file.suffix != '.csv':  # Ensure only CSV files are processed
+            continue
+        digest = file_hash(csv_file)
+        if not rebuild and (hashes or {}).get(hash_property(csv_file.stem)) == digest:
+            print(f'{csv_file.stem}: unchanged')
+            continue
+
+        # Identify products by their link, and edit "link" column, the ID being appended after
+        # all other columns so that references to them by position remain valid
         df = pd.read_csv(csv_file)
-        df['link'] = df.pop('link').apply(lambda x: f'=HYPERLINK("{x}")')
+        ids = df['link'].map(product_id)
+        df['link'] = '=HYPERLINK("' + df.pop('link') + '")'
+        df['id'] = ids
+        df = df.drop_duplicates('id')
+
+        # Update products in place
+        previous = previous_ids(book, parts[csv_file.stem]) if csv_file.stem in parts and not rebuild else None
+        if previous is not None:
+            df = arrange_rows(df, previous)
+        sheets[csv_file.stem] = df
+        changed[csv_file.stem] = digest
+        print(f'{csv_file.stem}: {len(df)} rows')
+
+    # Only new sheets require loading the workbook, all sheets are then streamed into the archive
+    if not sheets:
+        return sheets
+    if hashes is None or not set(sheets) <= set(parts):
+        add_sheets(book, sheets, changed)
+    patch_book(book, sheets, changed)
+    return sheets
+
 
-        # Add or overwrite a worksheet
-        sheet_name = csv_file.stem
-        if sheet_name in book.sheetnames:
-            book.remove(book[sheet_name])
-        sheet = book.create_sheet(title=sheet_name)
+def main():
+    parser = argparse.ArgumentParser(description='Collect the filtered products in a spreadsheet')
+    parser.add_argument('--rebuild', action='store_true', help='Rewrite all product sheets in the order of the CSV files, '
+                        'removing the rows of products which are not listed anymore')
+    args = parser.parse_args()
+    merge(rebuild=args.rebuild)
 
-        # Write DataFrame to the worksheet
-        for row in dataframe_to_rows(df, index=False, header=True):
-            sheet.append(row)
 
-# Save workbook
-book.save(BOOK)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from collections import Counter
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import threading
+import time
+import pandas as pd
+
+METRICS_DIR = Path('data/metrics')
+
+# Category being scraped, set by every scraper, also when scraping concurrently in separate tasks
+current_category = contextvars.ContextVar('category', default=None)
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{label_value(value)}"' for name, value in values.items()) + '}'
+
+
+class Metrics():
+
+    def __init__(self):
+        # Written from the event loop and from fetches in worker threads, read by the endpoint
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        # Duration and size of every fetch and parse, and counts of events, e.g. retries by error
+        self.observations = []
+        self.counters = Counter()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.observations = []
+            self.counters = Counter()
+
+    def observe(self, stage, url, seconds, size=None):
+        with self.lock:
+            self.observations.append({'category': current_category.get(), 'stage': stage, 'url': url,
+                                      'seconds': seconds, 'bytes': size})
+
+    def count(self, name, reason=None):
+        with self.lock:
+            self.counters[current_category.get(), name, reason] += 1
+
+    def stages(self):
+        # Count, duration and size of the observations of every category and stage
+        with self.lock:
+            df = pd.DataFrame(self.observations, columns=['category', 'stage', 'url', 'seconds', 'bytes'])
+        df['category'] = df['category'].fillna('')
+        return df.groupby(['category', 'stage'], as_index=False).agg(
+            count=('seconds', 'size'), seconds=('seconds', 'sum'), mean_seconds=('seconds', 'mean'), bytes=('bytes', 'sum'))
+
+    def events(self):
+        with self.lock:
+            return pd.DataFrame([(category or '', name, reason or '', count) for (category, name, reason), count in self.counters.items()],
+                                columns=['category', 'event', 'reason', 'count'])
+
+    def to_json(self, path):
+        report = {
+            'started_at': self.started_at,
+            'duration': time.time() - self.started_at,
+            'stages': self.stages().to_dict('records'),
+            'events': self.events().to_dict('records'),
+        }
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    def to_csv(self, path):
+        with self.lock:
+            pd.DataFrame(self.observations, columns=['category', 'stage', 'url', 'seconds', 'bytes']).to_csv(path, index=False)
+
+    def save(self, directory=METRICS_DIR):
+        # Summary and observations of the run, named after its start time
+        directory = Path(directory)
+        directory.mkdir(exist_ok=True, parents=True)
+        name = time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.started_at))
+        self.to_json(directory / f'{name}.json')
+        self.to_csv(directory / f'{name}.csv')
+        return directory / f'{name}.json'
+
+    def prometheus(self):
+        # Prometheus text exposition format, all metrics being counters since the start of the run
+        lines = []
+        stages = self.stages()
+        for metric, column, help in [('scraper_stage_total', 'count', 'Number of fetched or parsed pages'),
+                                     ('scraper_stage_seconds_total', 'seconds', 'Time spent fetching or parsing pages'),
+                                     ('scraper_stage_bytes_total', 'bytes', 'Size of the fetched pages')]:
+            lines += [f'# HELP {metric} {help}', f'# TYPE {metric} counter']
+            lines += [f'{metric}{labels(category=row.category, stage=row.stage)} {getattr(row, column)}'
+                      for row in stages.itertuples()]
+        lines += ['# HELP scraper_events_total Number of retries, discarded and failed products', '# TYPE scraper_events_total counter']
+        lines += [f'scraper_events_total{labels(category=row.category, event=row.event, reason=row.reason)} {row.count}'
+                  for row in self.events().itertuples()]
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port):
+        # Expose the metrics to Prometheus while scraping, from a background thread
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# Metrics of the current run, recorded by the scraper
+METRICS = Metrics()
@@ -0,0 +1,146 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+import pandas as pd
+
+# Number of candidates, and of candidate/front pairs, compared at once by the
+# block-nested-loop algorithm
+BLOCK_SIZE = 256
+BLOCK_PAIRS = 1 << 18
+
+
+def front_2d(costs):
+    # Sweep points in lexicographic order, a point is dominated iff an earlier point
+    # has a smaller or equal second cost
+    order = np.lexsort(costs.T[::-1])
+    sorted_costs = costs[order, 1]
+    running_min = np.minimum.accumulate(sorted_costs)
+    efficient = np.ones(len(costs), dtype=bool)
+    efficient[1:] = sorted_costs[1:] < running_min[:-1]
+    mask = np.zeros(len(costs), dtype=bool)
+    mask[order] = efficient
+    return mask
+
+
+def front_3d(costs):
+    # Sweep points in lexicographic order, keeping the staircase of the last two costs
+    # of the efficient points seen so far, sorted by increasing second (and decreasing
+    # third) cost
+    order = np.lexsort(costs.T[::-1])
+    mask = np.zeros(len(costs), dtype=bool)
+    stairs_y, stairs_z = [], []
+    for i, y, z in zip(order, costs[order, 1].tolist(), costs[order, 2].tolist()):
+
+        # Dominated if the step to the left of the point is not above it
+        position = bisect_right(stairs_y, y)
+        if position > 0 and stairs_z[position - 1] <= z:
+            continue
+        mask[i] = True
+
+        # Insert the point, removing the steps it covers
+        start = bisect_left(stairs_y, y)
+        end = start
+        while end < len(stairs_y) and stairs_z[end] >= z:
+            end += 1
+        stairs_y[start:end] = [y]
+        stairs_z[start:end] = [z]
+    return mask
+
+
+def weakly_dominated(candidates, front):
+    # Matrix telling whether every candidate is weakly dominated by every front point,
+    # accumulated one objective at a time to avoid a three-dimensional temporary
+    dominated = front[None, :, 0] <= candidates[:, None, 0]
+    for objective in range(1, candidates.shape[1]):
+        dominated &= front[None, :, objective] <= candidates[:, None, objective]
+    return dominated
+
+
+def front_nd(costs, block_size=BLOCK_SIZE):
+    # Sort by sum of costs, so a point can only be dominated by earlier points
+    order = np.lexsort((*costs.T[::-1], costs.sum(axis=1)))
+    mask = np.zeros(len(costs), dtype=bool)
+    front = np.empty((0, costs.shape[1]), dtype=costs.dtype)
+
+    for start in range(0, len(costs), block_size):
+        indices = order[start:start + block_size]
+        block = costs[indices]
+
+        # Compare candidates against the front found so far, strongest points first,
+        # only keeping candidates which are not yet dominated
+        alive = np.arange(len(block))
+        front_start = 0
+        while front_start < len(front) and len(alive):
+            front_end = front_start + max(block_size, BLOCK_PAIRS // len(alive))
+            front_block = front[front_start:front_end]
+            dominated = weakly_dominated(block[alive], front_block).any(axis=1)
+            alive = alive[~dominated]
+            front_start = front_end
+
+        # Compare remaining candidates against each other
+        candidates = block[alive]
+        earlier = np.tri(len(candidates), k=-1, dtype=bool)
+        dominated = (weakly_dominated(candidates, candidates) & earlier).any(axis=1)
+        alive = alive[~dominated]
+
+        front = np.concatenate([front, block[alive]])
+        mask[indices[alive]] = True
+    return mask
+
+
+def front(costs, distinct=True):
+    # Select the algorithm by number of objectives, all algorithms keep the first
+    # of several identical points only
+    if len(costs) == 0:
+        return np.zeros(0, dtype=bool)
+    if costs.shape[1] == 1:
+        mask = np.zeros(len(costs), dtype=bool)
+        mask[np.argmin(costs[:, 0])] = True
+    elif costs.shape[1] == 2:
+        mask = front_2d(costs)
+    elif costs.shape[1] == 3:
+        mask = front_3d(costs)
+    else:
+        mask = front_nd(costs)
+
+    # Also return the duplicates of efficient points if not distinct
+    if not distinct:
+        duplicates = pd.DataFrame(costs).groupby(list(range(costs.shape[1]))).ngroup().to_numpy()
+        mask = np.isin(duplicates, duplicates[mask])
+    return mask
+
+
+def to_costs(df, sense):
+    # Minimization costs of all min and max objectives
+    columns = [df.iloc[:, i].to_numpy(dtype=float) for i, s in enumerate(sense) if s == 'min']
+    columns += [-df.iloc[:, i].to_numpy(dtype=float) for i, s in enumerate(sense) if s == 'max']
+    return np.column_stack(columns) if columns else np.zeros((len(df), 0))
+
+
+def paretoset(df, sense, distinct=True):
+    # Drop-in replacement for paretoset.paretoset, on DataFrames
+    df = pd.DataFrame(df)
+    costs = to_costs(df, sense)
+    diff_columns = [df.columns[i] for i, s in enumerate(sense) if s == 'diff']
+    if not diff_columns:
+        return front(costs, distinct)
+
+    # Using diff is equivalent to grouping by the diff columns
+    mask = np.zeros(len(df), dtype=bool)
+    groups = df.reset_index(drop=True).groupby(diff_columns, observed=True).indices
+    for indices in groups.values():
+        mask[indices] = front(costs[indices], distinct)
+    return mask
+
+
+def pareto_layers(df, sense, k=None):
+    # Index of the non-dominated layer of every row, -1 beyond the first k layers
+    df = pd.DataFrame(df).reset_index(drop=True)
+    layers = np.full(len(df), -1)
+    remaining = np.arange(len(df))
+    layer = 0
+    while len(remaining) and (k is None or layer < k):
+        mask = paretoset(df.iloc[remaining], sense, distinct=False)
+        layers[remaining[mask]] = layer
+        remaining = remaining[~mask]
+        layer += 1
+    return layers
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+import time
+from util import FILTERED_DATA_DIR, has_products, run_filter
+
+PRODUCTS = ['cpu', 'hdd', 'mobo', 'psu', 'ram', 'ssd']
+
+
+def run_product(name):
+    # Importing the product's module registers its filter, also in worker processes
+    importlib.import_module(name)
+    start = time.perf_counter()
+    df = run_filter(name)
+    return name, len(df), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filter all products in a single process')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of products to filter in parallel')
+    parser.add_argument('--only', type=str, default=None, help='Comma-separated list of products to filter')
+    args = parser.parse_args()
+
+    # Filter all products which were scraped
+    names = args.only.split(',') if args.only else PRODUCTS
+    names = [name for name in names if has_products(name)]
+    FILTERED_DATA_DIR.mkdir(exist_ok=True, parents=True)
+
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            results = list(executor.map(run_product, names))
+    else:
+        results = [run_product(name) for name in names]
+
+    for name, size, duration in results:
+        print(f'{name}: kept {size} entries in {duration:.2f} s')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,22 @@
 #!/usr/bin/env python
-from util import filter_dataframe
-import pandas as pd
-from paretoset import paretoset
+from util import filter_dataframe, register_parser, run_filter
 import re
+import units
 
-psu_power_regex = r'^(\d+) W$'
-psu_noise_level_regex = r'^(\d+\.?\d*)dBA$'
+psu_power_regex = re.compile(r'^(\d+) (W)$')
+psu_noise_level_regex = re.compile(r'^(\d+\.?\d*)(dBA)$')
 
-psu_objectives = ['price', 'power', 'max noise level']
-psu_objectives_sense = ['min', 'max', 'min']
 
+@register_parser('psu')
+def parse_psu(psu_df):
+    # Clean incomplete entries
+    psu_df = filter_dataframe(psu_df, psu_df['max noise level'].notna() & (psu_df['max noise level'] != '-'), 'max noise level present')
 
-def extract_power(power_str):
-    match = re.search(psu_power_regex, str(power_str))
-    if match:
-        return int(match.group(1))
-    else:
-        raise ValueError(f"Power string '{power_str}' does not match the required format.")
+    # Parse feature values, derived columns, objectives and filters are described in spec/psu.yaml
+    psu_df['power'] = units.power(psu_df['power'], 'W', psu_power_regex, 'Power', int)
+    psu_df['max noise level'] = units.noise_level(psu_df['max noise level'], psu_noise_level_regex, 'Noise level')
+    return psu_df
 
 
-def extract_noise_level(noise_level_str):
-    match = re.search(psu_noise_level_regex, str(noise_level_str))
-    if match:
-        return float(match.group(1))
-    else:
-        raise ValueError(f"Noise level string '{noise_level_str}' does not match the required format.")
-
-
-psu_df = pd.read_csv('data/complete/psu.csv')
-
-# Clean incomplete entries
-psu_df = filter_dataframe(psu_df, psu_df['max noise level'].notna() & (psu_df['max noise level'] != '-'), 'max noise level present')
-
-# Parse feature values
-psu_df['power'] = psu_df['power'].apply(extract_power)
-psu_df['max noise level'] = psu_df['max noise level'].apply(extract_noise_level)
-psu_df['price per W'] = psu_df['price'] / psu_df['power']
-
-# Find Pareto front
-psu_objectives_df = psu_df[psu_objectives]
-psu_pareto_mask = paretoset(psu_df[psu_objectives], sense=psu_objectives_sense)
-psu_df = filter_dataframe(psu_df, psu_pareto_mask, 'Pareto front')
-
-# Apply filters
-psu_df = filter_dataframe(psu_df, psu_df['color'] == 'black', 'black color')
-psu_df = filter_dataframe(psu_df, psu_df['form factor'] == 'ATX', 'ATX form factor')
-
-# Sort by price per W
-psu_df.sort_values('price per W', ascending=True, inplace=True)
-
-# Export
-psu_df.to_csv('data/filtered/psu.csv', index=False)
+if __name__ == "__main__":
+    run_filter('psu')
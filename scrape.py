@@ -1,18 +1,154 @@
 #!/usr/bin/env python
+import argparse
+import asyncio
+from contextlib import ExitStack
+from cache import PageCache
+from history import PriceHistory
+from metrics import METRICS, METRICS_DIR
+import pandas as pd
 from pathlib import Path
-from toppreise import Scraper
+from sinks import CSVSink, JSONLSink, ParquetSink
+import time
+from toppreise import (OFFER_COLUMNS, AsyncBrowser, Browser, CachedFetcher, HttpClient, Scraper, load_previous_products,
+                       offers_path, summarize_loads)
 
 SPECS_DIR = Path('spec')
 DATA_DIR = Path('data/complete')
+MAX_PRODUCTS = 400
 
 
-def main():
-    for spec in SPECS_DIR.iterdir():
+def scrape_options(spec, args):
+    output = DATA_DIR / f'{spec.stem}.csv'
+    return {
+        'previous': output if args.incremental and output.exists() else None,
+        'journal': DATA_DIR / f'{spec.stem}.journal.jsonl',
+        'resume': args.resume,
+    }
+
+
+def open_sinks(spec, scraper, args, stack):
+    # Products and their offers are written as they are scraped, replacing the previous files once the scrape completed
+    output = DATA_DIR / f'{spec.stem}.csv'
+    sinks = [stack.enter_context(CSVSink(output, scraper.columns))]
+    if args.parquet:
+        sinks.append(stack.enter_context(ParquetSink(output.with_suffix('.parquet'), scraper.columns, scraper.schema)))
+    if args.jsonl:
+        sinks.append(stack.enter_context(JSONLSink(output.with_suffix('.jsonl'), scraper.columns)))
+    return {'sinks': sinks, 'offer_sinks': [stack.enter_context(CSVSink(offers_path(output), OFFER_COLUMNS))]}
+
+
+def save(spec, scraper, args):
+    output = DATA_DIR / f'{spec.stem}.csv'
+    if args.history and scraper.count:
+        # Read back from the written file, the products are not kept in memory
+        with PriceHistory() as history:
+            changed = history.record(spec.stem, pd.DataFrame(load_previous_products(output).values()))
+        print(f'Recorded {changed} new or changed {spec.stem} products in the price history.')
+
+
+def summary(spec, scraper, elapsed):
+    return {
+        'category': spec.stem,
+        'products': scraper.count,
+        'reused': scraper.stats['reused'],
+        'resumed': scraper.stats['resumed'],
+        'duplicates': scraper.stats['duplicates'],
+        'merged': scraper.stats['merged'],
+        'discarded': scraper.stats['discarded'],
+        'failed': len(scraper.failed),
+        'time [s]': round(elapsed, 1),
+    }
+
+
+def scrape_sequential(specs, browser, args):
+    results = []
+    for spec in specs:
         print(f'=== {spec.stem} ===')
-        scraper = Scraper.from_yaml(spec)
-        scraper.scrape(max_products=400)
-        DATA_DIR.mkdir(exist_ok=True, parents=True)
-        scraper.to_csv(DATA_DIR / f'{spec.stem}.csv')
+        start = time.perf_counter()
+        scraper = Scraper.from_yaml(spec, browser)
+        with ExitStack() as stack:
+            scraper.scrape(max_products=MAX_PRODUCTS, rate_limit=args.rate_limit, **open_sinks(spec, scraper, args, stack),
+                           **scrape_options(spec, args))
+        save(spec, scraper, args)
+        results.append(summary(spec, scraper, time.perf_counter() - start))
+    return results
+
+
+async def scrape_parallel(specs, fetcher, args):
+    # Categories are scraped concurrently, sharing a single browser pool, so that
+    # the concurrency and the rate limit apply to all categories together
+    async with AsyncBrowser.from_fetcher(fetcher, args.concurrency, args.rate_limit) as browser:
+
+        async def scrape_spec(position, spec):
+            start = time.perf_counter()
+            scraper = Scraper.from_yaml(spec, fetcher)
+            with ExitStack() as stack:
+                await scraper.scrape_async(max_products=MAX_PRODUCTS, browser=browser, position=position, log=False,
+                                           **open_sinks(spec, scraper, args, stack), **scrape_options(spec, args))
+            save(spec, scraper, args)
+            return summary(spec, scraper, time.perf_counter() - start)
+
+        results = await asyncio.gather(*[scrape_spec(position, spec) for position, spec in enumerate(specs)])
+        return results, browser.loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape all products in the spec directory')
+    parser.add_argument('--only', type=str, help='Comma-separated categories to scrape, e.g. cpu,ram')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of pages to fetch concurrently, over all categories, which are scraped in parallel if greater than 1')
+    parser.add_argument('--rate-limit', type=float, default=4, help='Maximum number of requests per second to the same host')
+    parser.add_argument('--http', action='store_true', help='Fetch pages over plain HTTP, falling back to the browser')
+    parser.add_argument('--cache', action='store_true', help='Cache pages on disk, under data/cache')
+    parser.add_argument('--offline', action='store_true', help='Only serve pages from the cache')
+    parser.add_argument('--search-ttl', type=float, default=1, help='Time-to-live of cached search pages, in hours')
+    parser.add_argument('--product-ttl', type=float, default=7 * 24, help='Time-to-live of cached product pages, in hours')
+    parser.add_argument('--cache-size', type=float, default=1024, help='Maximum size of the cache, in MB')
+    parser.add_argument('--incremental', action='store_true', help='Only scrape new products and products whose price changed')
+    parser.add_argument('--resume', action='store_true', help='Resume an interrupted scrape from its journal, under data/complete')
+    parser.add_argument('--parquet', action='store_true', help='Also write typed Parquet files next to the CSV files')
+    parser.add_argument('--jsonl', action='store_true', help='Also write JSON Lines files next to the CSV files')
+    parser.add_argument('--page-loads', type=str, help='Write the bytes, time and blocked requests of every page loaded in the browser to a CSV file')
+    parser.add_argument('--metrics', action='store_true', help=f'Write the fetch and parse times, page sizes, retries and discard reasons to {METRICS_DIR}')
+    parser.add_argument('--metrics-port', type=int, help='Serve the metrics in the Prometheus text format on this port while scraping')
+    parser.add_argument('--history', action='store_true', help='Record the scraped products in the price history, data/history.sqlite')
+    args = parser.parse_args()
+
+    specs = sorted(SPECS_DIR.glob('*.yaml'))
+    if args.only is not None:
+        categories = args.only.split(',')
+        unknown = set(categories) - {spec.stem for spec in specs}
+        if unknown:
+            parser.error(f'unknown categories: {", ".join(sorted(unknown))}')
+        specs = [spec for spec in specs if spec.stem in categories]
+
+    # Share a single browser across all specs
+    browser = HttpClient(fallback=Browser()) if args.http else Browser()
+    if args.cache or args.offline:
+        ttl = {'search': args.search_ttl * 3600, 'product': args.product_ttl * 3600}
+        cache = PageCache(ttl=ttl, max_size=args.cache_size * 1024 ** 2)
+        browser = CachedFetcher(browser, cache, args.offline)
+    if args.metrics_port is not None:
+        METRICS.serve(args.metrics_port)
+    start = time.perf_counter()
+    try:
+        # The synchronous browser is started on first use, only the async one is used in parallel
+        if args.concurrency > 1:
+            results, loads = asyncio.run(scrape_parallel(specs, browser, args))
+        else:
+            results = scrape_sequential(specs, browser, args)
+            loads = browser.loads
+    finally:
+        browser.close()
+
+    print(pd.DataFrame(results).to_string(index=False))
+    print(f'Scraped {len(results)} categories in {time.perf_counter() - start:.1f} s')
+    print(summarize_loads(loads))
+    if args.page_loads is not None:
+        pd.DataFrame(loads, columns=['url', 'time', 'bytes', 'html bytes', 'blocked']).to_csv(args.page_loads, index=False)
+    if args.metrics:
+        print(METRICS.stages().to_string(index=False))
+        print(f'Wrote metrics to {METRICS.save()}')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Number of products buffered per Parquet row group
+ROW_GROUP_SIZE = 1000
+
+
+class Sink():
+    # Appends products to a file as they are scraped. The file is written under a temporary
+    # name and only replaces the previous file once complete, an interrupted scrape leaving
+    # the products written so far in the partial file
+
+    def __init__(self, path, columns=None):
+        self.path = Path(path)
+        self.partial_path = self.path.with_name(self.path.name + '.part')
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        # Columns are listed by the spec, or taken from the first product
+        self.columns = list(columns) if columns is not None else None
+        self.count = 0
+
+    def write(self, product):
+        if self.columns is None:
+            self.columns = list(product)
+        self.count += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CSVSink(Sink):
+
+    def __init__(self, path, columns=None):
+        super().__init__(path, columns)
+        self.file = open(self.partial_path, 'w', newline='')
+        self.writer = None
+
+    def write(self, product):
+        super().write(product)
+        # Same format as DataFrame.to_csv, missing values being left empty
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, self.columns, extrasaction='ignore', lineterminator='\n')
+            self.writer.writeheader()
+        self.writer.writerow(product)
+        self.file.flush()
+
+    def close(self):
+        if self.writer is None and self.columns is not None:
+            csv.writer(self.file, lineterminator='\n').writerow(self.columns)
+        self.file.close()
+        super().close()
+
+    def abort(self):
+        self.file.close()
+
+
+class JSONLSink(Sink):
+
+    def __init__(self, path, columns=None):
+        super().__init__(path, columns)
+        self.file = open(self.partial_path, 'w')
+
+    def write(self, product):
+        super().write(product)
+        self.file.write(json.dumps({column: product.get(column) for column in self.columns}) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+    def abort(self):
+        self.file.close()
+
+
+def arrow_type(dtype, values):
+    # Arrow type of a column with the dtype given in the spec, the same for every row group,
+    # other columns being floats or strings, as scraped
+    import pyarrow as pa
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype in ('string', 'str', 'object'):
+        return pa.string()
+    if dtype is not None:
+        return pa.from_numpy_dtype(np.dtype(dtype))
+    if pd.api.types.is_float_dtype(values):
+        return pa.float64()
+    return pa.string()
+
+
+class ParquetSink(Sink):
+
+    def __init__(self, path, columns=None, schema=None):
+        super().__init__(path, columns)
+        self.schema = schema or {}
+        self.rows = []
+        self.writer = None
+
+    def write(self, product):
+        super().write(product)
+        self.rows.append(product)
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        # Parquet support is optional, as for DataFrame.to_parquet
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.writer is not None and not self.rows:
+            return
+        df = pd.DataFrame(self.rows, columns=self.columns)
+        df = df.astype({column: dtype for column, dtype in self.schema.items() if column in df})
+        if self.writer is None:
+            # The schema of the first row group is kept for all others
+            arrow_schema = pa.schema([(column, arrow_type(self.schema.get(column), df[column])) for column in df.columns])
+            self.writer = pq.ParquetWriter(self.partial_path, arrow_schema)
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        super().close()
+
+    def abort(self):
+        # Keep the complete row groups
+        if self.writer is not None:
+            self.writer.close()
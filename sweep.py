@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+import itertools
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import yaml
+from build import CATEGORIES, DEFAULT_OBJECTIVE, builds_to_dataframe, prune_parts, score_parts, search
+from criteria import Criteria, combined_mask
+from util import COMPLETE_DATA_DIR, SPECS_DIR, parse_products
+
+SWEEP_FILE = Path('sweep.yaml')
+RESULTS_FILE = Path('data/sweep.csv')
+
+OPERATORS = {
+    '>=': np.greater_equal,
+    '>': np.greater,
+    '<=': np.less_equal,
+    '<': np.less,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+
+def load_grid(path):
+    with open(path, 'r') as file:
+        grid = yaml.safe_load(file)
+    return grid.get('budget', []), grid.get('thresholds') or {}
+
+
+def variant_masks(df, base, thresholds):
+    # Masks of all combinations of threshold values, one column per combination,
+    # broadcasting the mask of every threshold against the combinations before it
+    masks = base.to_numpy()[:, None]
+    for threshold in thresholds:
+        values = df.eval(threshold['expression']).to_numpy()
+        mask = OPERATORS[threshold['operator']](values[:, None], np.asarray(threshold['values'])[None, :])
+        masks = (masks[:, :, None] & mask[:, None, :]).reshape(len(df), -1)
+    return masks
+
+
+def product_variants(name, thresholds):
+    # Parse the product and evaluate its fixed filters once, the swept rules are
+    # replaced by the thresholds
+    importlib.import_module(name)
+    criteria = Criteria.from_yaml(SPECS_DIR / f'{name}.yaml')
+    criteria = criteria.update({'filters': {threshold['rule']: None for threshold in thresholds if 'rule' in threshold}})
+    df = criteria.add_derived(parse_products(name))
+    base = combined_mask(df, criteria.filters, log=False)
+
+    # Pareto front, front filters and sort order of every combination
+    rest = Criteria(objectives=criteria.objectives, front_filters=criteria.front_filters, sort=criteria.sort)
+    keys = itertools.product(*[threshold['values'] for threshold in thresholds])
+    masks = variant_masks(df, base, thresholds)
+    return {key: rest.apply(df[masks[:, i]], log=False) for i, key in enumerate(keys)}
+
+
+def run_scenario(parts, budgets, counts, min_power, top):
+    results = []
+    for budget in budgets:
+        builds = builds_to_dataframe(search(parts, budget, counts, min_power, top), counts)
+        builds.insert(0, 'rank', range(1, len(builds) + 1))
+        builds.insert(0, 'budget', budget)
+        results.append(builds if len(builds) else pd.DataFrame({'budget': [budget]}))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the best builds for every combination of budgets and filter thresholds')
+    parser.add_argument('grid', type=str, nargs='?', default=str(SWEEP_FILE), help='Parameter grid file')
+    parser.add_argument('--top', type=int, default=1, help='Number of builds to return per scenario')
+    parser.add_argument('--ssds', type=int, default=1, help='Number of SSDs')
+    parser.add_argument('--hdds', type=int, default=0, help='Number of HDDs')
+    parser.add_argument('--min-power', type=float, default=650, help='Minimum PSU power, in W')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of scenarios to search in parallel')
+    parser.add_argument('--output', type=str, default=str(RESULTS_FILE), help='Output file path')
+    args = parser.parse_args()
+
+    budgets, thresholds = load_grid(args.grid)
+    counts = {'ssd': args.ssds, 'hdd': args.hdds}
+    categories = [category for category in CATEGORIES
+                  if counts.get(category, 1) > 0 and (COMPLETE_DATA_DIR / f'{category}.csv').exists()]
+
+    # Score and prune the candidates of every product variant once
+    names = {category: [name for name, threshold in thresholds.items() if threshold['product'] == category] for category in categories}
+    variants = {}
+    for category in categories:
+        keys = []
+        for key, df in product_variants(category, [thresholds[name] for name in names[category]]).items():
+            parts = score_parts({category: df}, DEFAULT_OBJECTIVE, counts)
+            variants[category, key] = prune_parts(parts, args.top, log=False)[category]
+            keys.append(key)
+        print(f'{category}: {len(keys)} variants')
+
+    # Every combination of product variants is a scenario, searched for all budgets
+    scenarios = []
+    for keys in itertools.product(*[[key for c, key in variants if c == category] for category in categories]):
+        parameters = {name: value for category, key in zip(categories, keys) for name, value in zip(names[category], key)}
+        parts = {category: variants[category, key] for category, key in zip(categories, keys)}
+        scenarios.append((parameters, parts))
+
+    jobs = [(parts, budgets, counts, args.min_power, args.top) for _, parts in scenarios]
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            results = list(executor.map(run_scenario, *zip(*jobs)))
+    else:
+        results = [run_scenario(*job) for job in jobs]
+
+    # Tidy table, with one row per build of every scenario
+    tables = []
+    for (parameters, _), builds in zip(scenarios, results):
+        for df in builds:
+            for position, (name, value) in enumerate(parameters.items()):
+                df.insert(1 + position, name, value)
+            tables.append(df)
+    df = pd.concat(tables, ignore_index=True)
+    columns = ['budget'] + list(thresholds) + ['score', 'price']
+    print(df.reindex(columns=columns).to_string(index=False))
+    df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,175 +1,1392 @@
 #!/usr/bin/env python
 import argparse
-from bs4 import BeautifulSoup
+import asyncio
+import hashlib
+import json
+import lxml.html
+from lxml import etree
+from metrics import METRICS, current_category
+from sinks import CSVSink
 import pandas as pd
-from playwright.sync_api import sync_playwright
+from pathlib import Path
+from playwright.async_api import async_playwright
+from playwright.sync_api import Error, sync_playwright
+import random
 import re
+import requests
+from requests.adapters import HTTPAdapter
+import time
 from tqdm import tqdm
+from urllib.parse import urlparse
 import yaml
 
 ungrouped_variants_query = '1299760721062_fi_pcds_v=0'
 
 
-def scrape_website(url):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36")
-        page = context.new_page()
-        page.goto(url, timeout=60000)
-        # try:
-        #     page.wait_for_selector("button.fc-button.fc-cta-consent.fc-primary-button", timeout=5000)
-        #     page.click("button.fc-button.fc-cta-consent.fc-primary-button")
-        # except Exception as e:
-        #     print("Cookie popup not found or already dismissed.")
-        html_content = page.content()
-        browser.close()
-        return html_content
+user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+
+
+class MissingMarkupError(Exception):
+    # Page served without the nodes we parse, e.g. when only rendered client-side
+    pass
+
+
+# Errors worth retrying: browser errors and timeouts, network errors, and pages
+# missing expected markup, e.g. when not fully loaded. Pages which cannot be parsed
+# are discarded instead
+TRANSIENT_ERRORS = (Error, OSError, MissingMarkupError)
+# HTTP requests are only retried after connection errors and timeouts, when rate limited or after
+# server errors, other client errors such as 404 are permanent
+TRANSIENT_REQUEST_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+TRANSIENT_STATUS_CODES = {429}
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 60
+
+# Requests aborted by the browser by default, which the parsed content does not depend on
+BLOCKED_RESOURCE_TYPES = ['image', 'media', 'font']
+FIRST_PARTY_DOMAIN = 'toppreise.ch'
+
+# Bytes transferred for the document and the resources it loaded so far
+TRANSFER_SIZE_SCRIPT = '() => performance.getEntries().reduce((size, entry) => size + (entry.transferSize || 0), 0)'
+
+
+def is_transient(error):
+    # Requests errors are also OSErrors, they are checked first
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is not None and (status in TRANSIENT_STATUS_CODES or status >= 500)
+    if isinstance(error, requests.RequestException):
+        return isinstance(error, TRANSIENT_REQUEST_ERRORS)
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def retry_delay(attempt):
+    # Exponential backoff with full jitter, so concurrent workers do not retry in lockstep
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def retry(function, description, attempts=None):
+    # Attempts are read when called, e.g. so that benchmarks can disable retries
+    attempts = attempts or RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            return function()
+        except Exception as e:
+            if not is_transient(e) or attempt == attempts - 1:
+                raise
+            delay = retry_delay(attempt)
+            METRICS.count('retry', type(e).__name__)
+            print(f'Retrying {description} in {delay:.1f} s after error: {e}')
+            time.sleep(delay)
+
+
+async def retry_async(function, description, attempts=None):
+    attempts = attempts or RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            return await function()
+        except Exception as e:
+            if not is_transient(e) or attempt == attempts - 1:
+                raise
+            delay = retry_delay(attempt)
+            METRICS.count('retry', type(e).__name__)
+            print(f'Retrying {description} in {delay:.1f} s after error: {e}')
+            await asyncio.sleep(delay)
+
+
+class RequestBlocker():
+
+    def __init__(self, resource_types=BLOCKED_RESOURCE_TYPES, third_party=True, allow=()):
+        self.resource_types = set(resource_types)
+        self.third_party = third_party
+        self.allowed_domains = [FIRST_PARTY_DOMAIN, *allow]
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(config.get('resource types', BLOCKED_RESOURCE_TYPES), config.get('third party', True), config.get('allow', ()))
+
+    def blocks(self, request):
+        if request.resource_type in self.resource_types:
+            return True
+        # Requests to other sites, e.g. ads and analytics, data URLs have no host
+        host = urlparse(request.url).hostname
+        return self.third_party and host is not None and \
+            not any(host == domain or host.endswith('.' + domain) for domain in self.allowed_domains)
+
+
+def record_load(loads, url, start, size, html, blocked):
+    loads.append({'url': url, 'time': time.perf_counter() - start, 'bytes': size, 'html bytes': len(html), 'blocked': blocked})
+
+
+def summarize_loads(loads):
+    if not loads:
+        return 'No pages loaded in the browser'
+    df = pd.DataFrame(loads)
+    return (f"Loaded {len(df)} pages in the browser, transferring {df['bytes'].sum() / 1024 ** 2:.1f} MB "
+            f"in {df['time'].mean():.2f} s per page on average, blocking {df['blocked'].sum()} requests")
+
+
+class Browser():
+
+    def __init__(self, headless=True, max_page_uses=50, blocker=None, wait_until='domcontentloaded'):
+        self.headless = headless
+        self.max_page_uses = max_page_uses
+        self.blocker = blocker if blocker is not None else RequestBlocker()
+        self.wait_until = wait_until
+        # Blocker of the current page load, and requests it blocked
+        self.page_blocker = self.blocker
+        self.blocked = 0
+        # Bytes, time and blocked requests of every page load
+        self.loads = []
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.page_uses = 0
+
+    def start(self):
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(headless=self.headless)
+        self.context = self.browser.new_context(user_agent=user_agent)
+        self.page = None
+        self.page_uses = 0
+
+    def restart(self):
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except Error:
+            # Browser already crashed, nothing left to close
+            pass
+        self.start()
+
+    def close(self):
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Error:
+                pass
+            self.browser = None
+            self.context = None
+            self.page = None
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_page(self):
+        # Recycle the page every few uses to bound the memory it accumulates
+        if self.page is not None and self.page_uses >= self.max_page_uses:
+            self.discard_page()
+        if self.page is None:
+            self.page = self.context.new_page()
+            self.page.route('**/*', self.handle_route)
+            self.page_uses = 0
+        self.page_uses += 1
+        return self.page
+
+    def handle_route(self, route):
+        if self.page_blocker.blocks(route.request):
+            self.blocked += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    def fetch(self, url, blocker=None):
+        if self.browser is None:
+            self.start()
+        # Restart the browser and retry once if it crashed or was disconnected
+        for attempt in range(2):
+            if not self.browser.is_connected():
+                self.restart()
+            try:
+                page = self.get_page()
+                self.page_blocker = blocker if blocker is not None else self.blocker
+                self.blocked = 0
+                start = time.perf_counter()
+                page.goto(url, timeout=60000, wait_until=self.wait_until)
+                # try:
+                #     page.wait_for_selector("button.fc-button.fc-cta-consent.fc-primary-button", timeout=5000)
+                #     page.click("button.fc-button.fc-cta-consent.fc-primary-button")
+                # except Exception as e:
+                #     print("Cookie popup not found or already dismissed.")
+                html = page.content()
+                if not has_expected_markup(url, html):
+                    # Content rendered by scripts after the DOM was loaded
+                    page.wait_for_load_state('load')
+                    html = page.content()
+                record_load(self.loads, url, start, page.evaluate(TRANSFER_SIZE_SCRIPT), html, self.blocked)
+                return html
+            except Error:
+                if attempt == 0 and not self.browser.is_connected():
+                    continue
+                # Discard the page, it may be left in an unusable state
+                self.discard_page()
+                raise
+
+    def discard_page(self):
+        if self.page is not None:
+            try:
+                self.page.close()
+            except Error:
+                pass
+            self.page = None
+
+
+def scrape_website(url, browser=None, blocker=None):
+    start = time.perf_counter()
+    if browser is None:
+        with Browser() as browser:
+            html = browser.fetch(url, blocker)
+    else:
+        html = browser.fetch(url, blocker)
+    METRICS.observe('fetch', url, time.perf_counter() - start, len(html))
+    return html
+
+
+async def scrape_website_async(url, browser, blocker=None):
+    start = time.perf_counter()
+    html = await browser.fetch(url, blocker)
+    METRICS.observe('fetch', url, time.perf_counter() - start, len(html))
+    return html
+
+
+def has_expected_markup(url, html):
+    # Check for the nodes we parse, in case they are only rendered client-side
+    if url.startswith('https://www.toppreise.ch/price-comparison'):
+        return 'Plugin_Price' in html and 'Plugin_ProductNgfFeatureCategory_' in html
+    else:
+        return 'f_hits' in html and 'Plugin_Product' in html
+
+
+class HttpClient():
+
+    def __init__(self, fallback=None, pool_size=8):
+        self.fallback = fallback
+        # Keep-alive connections are pooled by the session, responses are decompressed transparently
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent, 'Accept-Encoding': 'gzip, deflate'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, url, etag=None, last_modified=None):
+        # Conditional request, if validators of a previous response are given
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        response = self.session.get(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        return response
+
+    def get(self, url):
+        # Return the server-rendered HTML, or None if it lacks the nodes we need
+        html = self.request(url).text
+        if has_expected_markup(url, html):
+            return html
+        return None
+
+    def fetch(self, url, blocker=None):
+        html = self.get(url)
+        if html is None:
+            if self.fallback is None:
+                raise MissingMarkupError(f'Page {url} is missing expected markup')
+            html = self.fallback.fetch(url, blocker)
+        return html
+
+    @property
+    def loads(self):
+        return self.fallback.loads if self.fallback is not None else []
+
+
+class CachedFetcher():
 
+    def __init__(self, fetcher, cache, offline=False):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.offline = offline
 
-def get_number_of_products(search_results_url):
-    html = scrape_website(search_results_url)
-    soup = BeautifulSoup(html, "html.parser")
-    hits_string = soup.find('span', class_='f_hits').text
-    return int(re.match(r"^([\d']+) hits$", hits_string).group(1).replace("'", ""))
+    def close(self):
+        self.fetcher.close()
 
+    def __enter__(self):
+        return self
 
-def get_product_list(search_results_url):
-    html = scrape_website(search_results_url)
-    soup = BeautifulSoup(html, "html.parser")
-    matching_nodes = soup.find_all(id=re.compile(r"^Plugin_Product_.*"))
-    matching_nodes += soup.find_all(id=re.compile(r"^Plugin_Offer_.*"))
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def loads(self):
+        return self.fetcher.loads
+
+    def fetch(self, url, blocker=None):
+        entry = self.cache.load(url)
+        if entry is not None:
+            html, meta = entry
+            if self.offline or self.cache.is_fresh(url, meta):
+                return html
+        elif self.offline:
+            raise KeyError(f'Page {url} not found in cache')
+
+        if isinstance(self.fetcher, HttpClient):
+            # Revalidate stale entries, if the server gave us validators
+            validators = (meta['etag'], meta['last_modified']) if entry is not None else ()
+            response = self.fetcher.request(url, *validators)
+            if response.status_code == 304:
+                self.cache.touch(url)
+                return html
+            if has_expected_markup(url, response.text):
+                self.cache.put(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                return response.text
+            if self.fetcher.fallback is None:
+                raise MissingMarkupError(f'Page {url} is missing expected markup')
+            html = self.fetcher.fallback.fetch(url, blocker)
+        else:
+            html = self.fetcher.fetch(url, blocker)
+        self.cache.put(url, html)
+        return html
+
+
+class RateLimiter():
+
+    def __init__(self, rate):
+        # Maximum number of requests per second to any single host
+        self.interval = 1 / rate if rate else 0
+        self.next_request = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        # Reserve the next free slot for the host, then sleep until it is due
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_request.get(host, now))
+            self.next_request[host] = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+class AsyncBrowser():
+
+    def __init__(self, concurrency=8, rate_limit=4, headless=True, http=None, cache=None, offline=False, blocker=None,
+                 wait_until='domcontentloaded'):
+        self.concurrency = concurrency
+        self.headless = headless
+        self.blocker = blocker if blocker is not None else RequestBlocker()
+        self.wait_until = wait_until
+        # Blocker of the current load of every page, and requests it blocked
+        self.page_blockers = {}
+        self.blocked = {}
+        # Bytes, time and blocked requests of every page load
+        self.loads = []
+        self.http = http
+        self.cache = cache
+        self.offline = offline
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.restart_lock = asyncio.Lock()
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.pages = []
+
+    @classmethod
+    def from_fetcher(cls, fetcher, concurrency=8, rate_limit=4):
+        # Reuse the HTTP client, cache and browser settings of a synchronous fetcher, if any
+        cache, offline = None, False
+        if isinstance(fetcher, CachedFetcher):
+            cache, offline = fetcher.cache, fetcher.offline
+            fetcher = fetcher.fetcher
+        http = fetcher if isinstance(fetcher, HttpClient) else None
+        browser = fetcher.fallback if http is not None else fetcher
+        if isinstance(browser, Browser):
+            return cls(concurrency, rate_limit, browser.headless, http, cache, offline, browser.blocker, browser.wait_until)
+        return cls(concurrency, rate_limit, http=http, cache=cache, offline=offline)
+
+    async def start(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        self.context = await self.browser.new_context(user_agent=user_agent)
+        self.pages = []
+
+    async def restart(self, browser):
+        # Only the first worker noticing the crash restarts the browser
+        async with self.restart_lock:
+            if self.browser is browser:
+                try:
+                    await self.browser.close()
+                except Error:
+                    pass
+                await self.start()
+
+    async def close(self):
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Error:
+                pass
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def __aenter__(self):
+        # No browser is needed when serving from cache only
+        if not self.offline:
+            await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def new_page(self):
+        page = await self.context.new_page()
+
+        async def handle_route(route):
+            if self.page_blockers[page].blocks(route.request):
+                self.blocked[page] += 1
+                await route.abort()
+            else:
+                await route.continue_()
+        await page.route('**/*', handle_route)
+        return page
+
+    async def fetch(self, url, blocker=None):
+        # Serve from cache if possible, only serve from cache in offline mode
+        if self.cache is not None:
+            html = self.cache.get(url, stale=self.offline)
+            if html is not None:
+                return html
+            elif self.offline:
+                raise KeyError(f'Page {url} not found in cache')
+        html = await self.fetch_page(url, blocker)
+        if self.cache is not None:
+            self.cache.put(url, html)
+        return html
+
+    async def fetch_page(self, url, blocker=None):
+        async with self.semaphore:
+            # Try the plain HTTP fast path first, if enabled
+            if self.http is not None:
+                await self.rate_limiter.wait(url)
+                html = await asyncio.to_thread(self.http.get, url)
+                if html is not None:
+                    return html
+
+            # Restart the browser and retry once if it crashed or was disconnected
+            for attempt in range(2):
+                browser = self.browser
+                # Reuse an idle page, at most one page is open per worker
+                page = self.pages.pop() if self.pages else await self.new_page()
+                self.page_blockers[page] = blocker if blocker is not None else self.blocker
+                self.blocked[page] = 0
+                try:
+                    await self.rate_limiter.wait(url)
+                    start = time.perf_counter()
+                    await page.goto(url, timeout=60000, wait_until=self.wait_until)
+                    html = await page.content()
+                    if not has_expected_markup(url, html):
+                        # Content rendered by scripts after the DOM was loaded
+                        await page.wait_for_load_state('load')
+                        html = await page.content()
+                    record_load(self.loads, url, start, await page.evaluate(TRANSFER_SIZE_SCRIPT), html, self.blocked[page])
+                    self.pages.append(page)
+                    return html
+                except Error:
+                    if attempt == 0 and not browser.is_connected():
+                        await self.restart(browser)
+                        continue
+                    try:
+                        await page.close()
+                    except Error:
+                        pass
+                    raise
+
+
+def has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Selectors are compiled once, and evaluated on the lxml tree
+hits_regex = re.compile(r"^([\d']+) hits$")
+hits_xpath = etree.XPath(f"//span[{has_class('f_hits')}]")
+product_nodes_xpath = etree.XPath("//*[starts-with(@id, 'Plugin_Product_')]")
+offer_nodes_xpath = etree.XPath("//*[starts-with(@id, 'Plugin_Offer_')]")
+link_xpath = etree.XPath(".//a")
+listing_price_xpath = etree.XPath(f".//div[{has_class('Plugin_Price')}]")
+price_xpath = etree.XPath(f"//div[{has_class('Plugin_Price')}]")
+manufacturer_xpath = etree.XPath(f"//span[{has_class('manu')}]")
+title_break_xpath = etree.XPath("//span[@class='title break']")
+title_xpath = etree.XPath(f"//span[{has_class('title')}]")
+category_nodes_xpath = etree.XPath("//*[starts-with(@id, 'Plugin_ProductNgfFeatureCategory_')]")
+category_name_xpath = etree.XPath(f".//div[{has_class('featureCatName')}]")
+feature_nodes_xpath = etree.XPath(".//*[starts-with(@id, 'Plugin_ProductNgfFeature_')]")
+feature_name_xpath = etree.XPath(f".//div[{has_class('name')}]")
+feature_value_xpath = etree.XPath(f".//div[{has_class('value')}]")
+listing_title_xpath = etree.XPath(f".//*[{has_class('title')}]")
+merchant_xpath = etree.XPath(f".//*[{has_class('shopName')}]")
+stock_xpath = etree.XPath(f".//*[{has_class('availability')}]")
+shipping_xpath = etree.XPath(f".//*[{has_class('shippingCost')}]")
+
+# Amounts in CHF, e.g. "1'299.00" or "12.–", and stock descriptions in English or German
+amount_regex = re.compile(r"\d[\d']*(?:\.\d+)?")
+free_regex = re.compile(r'\b(free|gratis|kostenlos)\b', re.IGNORECASE)
+in_stock_regex = re.compile(r'\b(in stock|available|an lager|ab lager|lieferbar|sofort)', re.IGNORECASE)
+out_of_stock_regex = re.compile(r'\b(not|nicht|out of|no longer|unknown|unbekannt)\b', re.IGNORECASE)
+name_separator_regex = re.compile(r'[\W_]+')
+
+# Columns of the offers table, one row per merchant offering a product
+OFFER_COLUMNS = ['link', 'merchant', 'price', 'shipping', 'stock', 'in stock']
+
+
+def parse_html(html):
+    return lxml.html.document_fromstring(html)
+
+
+def find_text(xpath, node):
+    # Text of the first matching node, like BeautifulSoup's find().text
+    matches = xpath(node)
+    if not matches:
+        raise ValueError(f'No node matches {xpath.path}')
+    return matches[0].text_content().strip()
+
+
+def find_optional_text(xpath, node):
+    matches = xpath(node)
+    return matches[0].text_content().strip() if matches else None
+
+
+def read_number_of_products(tree):
+    hits_string = find_text(hits_xpath, tree)
+    return int(hits_regex.match(hits_string).group(1).replace("'", ""))
+
+
+def parse_number_of_products(html):
+    return read_number_of_products(parse_html(html))
+
+
+def read_product_list(tree):
+    matching_nodes = product_nodes_xpath(tree)
+    matching_nodes += offer_nodes_xpath(tree)
     return matching_nodes
 
 
+def parse_product_list(html):
+    return read_product_list(parse_html(html))
+
+
+def parse_search_page(html):
+    # Hit count and product nodes of a search page, parsed once
+    tree = parse_html(html)
+    return read_number_of_products(tree), read_product_list(tree)
+
+
+def get_product_list(search_results_url, browser=None, blocker=None):
+    html = scrape_website(search_results_url, browser, blocker)
+    return parse_product_list(html)
+
+
 def get_product_link(product_node):
-    return 'https://www.toppreise.ch' + product_node.find_all('a')[0]['href']
+    return 'https://www.toppreise.ch' + link_xpath(product_node)[0].attrib['href']
+
+
+def get_product_listing_price(product_node):
+    # Price shown next to the product in the search page, if any
+    price_nodes = listing_price_xpath(product_node)
+    if not price_nodes:
+        return None
+    try:
+        return float(price_nodes[0].text_content().strip().replace("'", ""))
+    except ValueError:
+        return None
 
 
-def get_product_features(product_url, filter=None):
+def get_listing_key(product_node):
+    # Normalized title of a product in the search results, if shown
+    title = find_optional_text(listing_title_xpath, product_node)
+    if not title:
+        return None
+    return normalize_text(title) or None
+
+
+def parse_amount(text):
+    # Free shipping costs nothing, other amounts without a number are unknown
+    if text is None:
+        return None
+    match = amount_regex.search(text)
+    if match is None:
+        return 0.0 if free_regex.search(text) else None
+    return float(match.group().replace("'", ""))
+
+
+def is_in_stock(stock):
+    return stock is not None and in_stock_regex.search(stock) is not None and out_of_stock_regex.search(stock) is None
+
+
+def parse_offer(offer_node):
+    # Offer of a single merchant, in a product page or in the search results, None without a price
+    price = parse_amount(find_optional_text(listing_price_xpath, offer_node))
+    if price is None:
+        return None
+    merchant = find_optional_text(merchant_xpath, offer_node)
+    if not merchant:
+        links = link_xpath(offer_node)
+        merchant = urlparse(links[0].get('href', '')).hostname if links else None
+    stock = find_optional_text(stock_xpath, offer_node)
+    return {
+        'merchant': merchant,
+        'price': price,
+        'shipping': parse_amount(find_optional_text(shipping_xpath, offer_node)),
+        'stock': stock,
+        'in stock': is_in_stock(stock),
+    }
+
+
+def parse_offers(tree, product_url):
+    offer_nodes = offer_nodes_xpath(tree)
+    offers = [offer for offer in map(parse_offer, offer_nodes) if offer is not None]
+    # Report offers which the selectors do not match, rather than silently treating them as out of stock
+    if offer_nodes and (not offers or all(offer['stock'] is None for offer in offers)):
+        print(f'Could not parse the price or stock of the {len(offer_nodes)} offers of {product_url}')
+        METRICS.count('offers', 'unparsed')
+    return offers
+
+
+def load_previous_products(path):
+    # Keep values as they were written, only the price is compared
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df['price'] = df['price'].astype(float)
+    return {product['link']: product for product in df.to_dict('records')}
+
+
+def offers_path(path):
+    # Offers table written next to the products, e.g. data/complete/cpu.offers.csv
+    return Path(path).with_suffix('.offers.csv')
+
+
+def load_previous_offers(path):
+    # Offers of every product, as scraped from its page
+    if not offers_path(path).exists():
+        return {}
+    df = pd.read_csv(offers_path(path))
+    df = df.astype(object).where(df.notna(), None)
+    return {link: group.drop(columns='link').to_dict('records') for link, group in df.groupby('link', sort=False)}
+
+
+def is_product_url(url):
+    return url.startswith('https://www.toppreise.ch/price-comparison')
+
+
+def discard_external_url(product_url):
+    print(f'Discarding product {product_url} at unsupported URL')
+    METRICS.count('discarded', 'external URL')
+
+
+def is_supported_product_url(product_url):
     # Some Toppreise URLs point to external sites, we filter these together with any other
     # possibly unexpected URLs.
-    if not product_url.startswith('https://www.toppreise.ch/price-comparison'):
-        print(f'Discarding product {product_url} at unsupported URL')
+    if not is_product_url(product_url):
+        discard_external_url(product_url)
+        return False
+    return True
+
+
+product_id_regex = re.compile(r'-(p\d+)(?:[/?#]|$)')
+
+
+def product_id(product_url):
+    # Stable product ID, the product number at the end of Toppreise URLs (e.g. "...-p739447"),
+    # or a hash of any other URL
+    match = product_id_regex.search(product_url)
+    if match:
+        return match.group(1)
+    return 'h' + hashlib.sha1(product_url.encode('utf-8')).hexdigest()[:12]
+
+
+def normalize_text(text):
+    return name_separator_regex.sub(' ', text.lower()).strip()
+
+
+def normalize_name(name):
+    # Name without the details following the first comma, e.g. the variant
+    return normalize_text(name.split(',')[0])
+
+
+def product_key(manufacturer, name):
+    # Manufacturer and normalized name, the name usually starting with the manufacturer already
+    if not name:
         return None
-    else:
+    name = normalize_name(name)
+    manufacturer = normalize_name(manufacturer or '')
+    if manufacturer and not (name + ' ').startswith(manufacturer + ' '):
+        name = f'{manufacturer} {name}'
+    return name
+
+
+class ProductIndex():
+    # Scraped products by manufacturer, normalized name and features, so that different listings
+    # of the same product, e.g. of several variants, are merged into the first one
+
+    def __init__(self):
+        self.links = {}
+        # Link of the product every scraped link was merged into, its own if first listed
+        self.canonical = {}
+
+    def add(self, product):
+        link = product.get('link')
+        key = product_key(product.get('manufacturer'), product.get('name'))
+        if key is None:
+            self.canonical[link] = link
+            return link
+        # Products with the same name may still differ, e.g. in capacity, only their price may differ
+        features = {column: value for column, value in product.items()
+                    if column not in ('manufacturer', 'name', 'price', 'link', 'offers')}
+        digest = hashlib.sha1(json.dumps(features, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.canonical[link] = self.links.setdefault((key, digest), link)
+        return self.canonical[link]
+
+
+class FeatureFilter():
+
+    def __init__(self, entries):
+        self.entries = entries
+        # Map each requested category to the set of features requested in it
+        self.categories = {}
+        for entry in entries:
+            if isinstance(entry, dict):
+                category = list(entry.keys())[0]
+                self.categories.setdefault(category, set()).update(list(entry.values())[0])
+        self.size = sum(len(keys) for keys in self.categories.values())
+        # Columns of the filtered features, in the order of the entries
+        self.columns = list(dict.fromkeys(key for entry in entries
+                                          for key in (list(entry.values())[0] if isinstance(entry, dict) else [entry])))
+
+    def apply(self, features, product_url):
+        filtered_features = {}
         try:
-            # Parse product page HTML
-            html = scrape_website(product_url)
-            soup = BeautifulSoup(html, "html.parser")
-
-            # Get generic product features (price, manufacturer, name)
-            price = float(soup.find('div', attrs={'class': "Plugin_Price"}).text.strip().replace("'", ""))
-            manufacturer = soup.find('span', class_="manu").text.strip()
-            title = soup.find('span', class_="title break")
-            if title is None:
-                title = soup.find('span', class_="title")
-            name = title.text.strip().split(',')[0]
-            features = {
-                'manufacturer': manufacturer,
-                'name': name,
-                'price': price,
-                'link': product_url
-            }
-
-            # Get product feature categories
-            category_nodes = soup.find_all(id=re.compile(r"^Plugin_ProductNgfFeatureCategory_.*"))
-
-            # Iterate feature categories
-            for category_node in category_nodes:
-                category_name = category_node.find('div', class_='featureCatName').text.strip()
-                features[category_name] = {}
-
-                # Get features in category
-                feature_nodes = category_node.find_all(id=re.compile(r"^Plugin_ProductNgfFeature_.*"))
-
-                # Iterate features in category
-                for feature_node in feature_nodes:
-                    key = feature_node.find('div', class_='name').text.strip()
-                    value = feature_node.find('div', class_='value').text.strip()
-                    features[category_name][key] = value
-
-            # Filter features if requested
+            # Iterate entries in filter structure
+            for entry in self.entries:
+                # If entry is a category, feature is found in subkeys
+                if isinstance(entry, dict):
+                    category = list(entry.keys())[0]
+                    for feature in list(entry.values())[0]:
+                        filtered_features[feature] = features[category][feature]
+                else:
+                    filtered_features[entry] = features[entry]
+            return filtered_features
+        except KeyError as e:
+            print(f'Discarding product {product_url} missing required features: {e}')
+            METRICS.count('discarded', 'missing feature')
+            return None
+
+
+def parse_product_features(html, product_url, filter=None, offers=False):
+    # Accept the filter structure from the spec, but prefer it precompiled
+    if filter is not None and not isinstance(filter, FeatureFilter):
+        filter = FeatureFilter(filter)
+
+    tree = parse_html(html)
+
+    # Get generic product features (price, manufacturer, name)
+    price = float(find_text(price_xpath, tree).replace("'", ""))
+    manufacturer = find_text(manufacturer_xpath, tree)
+    title = title_break_xpath(tree) or title_xpath(tree)
+    name = title[0].text_content().strip().split(',')[0]
+    features = {
+        'manufacturer': manufacturer,
+        'name': name,
+        'price': price,
+        'link': product_url
+    }
+
+    # Get product feature categories
+    category_nodes = category_nodes_xpath(tree)
+    remaining_features = filter.size if filter is not None else None
+
+    # Iterate feature categories
+    for category_node in category_nodes:
+        category_name = find_text(category_name_xpath, category_node)
+
+        # Skip categories which are not requested
+        if filter is not None:
+            required_keys = filter.categories.get(category_name)
+            if required_keys is None:
+                continue
+            # Features of a repeated category are overwritten, as they would be without filter
+            if category_name in features:
+                remaining_features += len(features[category_name])
+        features[category_name] = {}
+
+        # Get features in category
+        feature_nodes = feature_nodes_xpath(category_node)
+
+        # Iterate features in category, skipping features which are not requested
+        for feature_node in feature_nodes:
+            key = find_text(feature_name_xpath, feature_node)
             if filter is not None:
-                filtered_features = {}
-                try:
-                    # Iterate entries in filter structure
-                    for entry in filter:
-                        # If entry is a category, feature is found in subkeys
-                        if isinstance(entry, dict):
-                            category = list(entry.keys())[0]
-                            for feature in list(entry.values())[0]:
-                                filtered_features[feature] = features[category][feature]
-                        else:
-                            filtered_features[entry] = features[entry]
-                    return filtered_features
-                except KeyError as e:
-                    print(f'Discarding product {product_url} missing required features: {e}')
-                    return None
-            else:
-                return features
+                if key not in required_keys:
+                    continue
+                if key not in features[category_name]:
+                    remaining_features -= 1
+            value = find_text(feature_value_xpath, feature_node)
+            features[category_name][key] = value
 
-        except Exception as e:
-            print(f"Error while scraping {product_url}: {e}")
+        # Stop as soon as all requested features are found
+        if remaining_features == 0:
+            break
+
+    # Filter features if requested
+    if filter is not None:
+        features = filter.apply(features, product_url)
+
+    # Offers of all merchants, stored apart from the features
+    if offers and features is not None:
+        features['offers'] = parse_offers(tree, product_url)
+    return features
+
+
+def parse_product_page(html, product_url, filter=None):
+    start = time.perf_counter()
+    try:
+        features = parse_product_features(html, product_url, filter, offers=True)
+    except ValueError as e:
+        # Missing nodes or unexpected values, e.g. a price on request, fetching the page again would not help
+        print(f'Discarding product {product_url} which could not be parsed: {e}')
+        METRICS.count('discarded', 'parse error')
+        features = None
+    METRICS.observe('parse', product_url, time.perf_counter() - start, len(html))
+    return features
+
+
+def get_product_features(product_url, filter=None, browser=None, blocker=None):
+    # Return None for incomplete products, raise if the page could not be scraped
+    if is_supported_product_url(product_url):
+        return retry(lambda: parse_product_page(scrape_website(product_url, browser, blocker), product_url, filter), product_url)
+
+
+async def get_product_features_async(product_url, filter, browser, blocker=None):
+    if is_supported_product_url(product_url):
+        async def get():
+            return parse_product_page(await scrape_website_async(product_url, browser, blocker), product_url, filter)
+        return await retry_async(get, product_url)
+
+
+class Journal():
+
+    def __init__(self, path, resume=False):
+        # Products and search pages completed by a previous run, if resuming
+        self.path = Path(path)
+        self.products = {}
+        self.discarded = set()
+        self.pages = {}
+        self.hits = None
+        self.listings = {}
+        self.listing_offers = {}
+        if resume and self.path.exists():
+            with open(self.path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line may be incomplete if the run was killed
+                        continue
+                    if 'product' in entry:
+                        self.products[entry['link']] = entry['product']
+                    elif 'discarded' in entry:
+                        self.discarded.add(entry['discarded'])
+                    elif 'offset' in entry:
+                        self.pages[entry['offset']] = entry['links']
+                    elif 'hits' in entry:
+                        self.hits = entry['hits']
+                    elif 'listing' in entry:
+                        self.listings[entry['key']] = entry['listing']
+                    elif 'listing offer' in entry:
+                        self.listing_offers[entry['listing offer']] = (entry['key'], entry['offer'])
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.file = open(self.path, 'a' if resume else 'w')
+
+    def write(self, entry):
+        # Flush every entry, so that it survives a crash
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def add_product(self, link, product):
+        # Only products of previous runs are kept in memory, every product is scraped once per run
+        self.write({'link': link, 'product': product})
+
+    def add_discarded(self, link):
+        self.discarded.add(link)
+        self.write({'discarded': link})
+
+    def add_listing(self, key, link):
+        self.write({'listing': link, 'key': key})
+
+    def add_listing_offer(self, link, key, offer):
+        self.write({'listing offer': link, 'key': key, 'offer': offer})
+
+    def add_hits(self, hits):
+        self.hits = hits
+        self.write({'hits': hits})
+
+    def add_page(self, offset, links):
+        self.pages[offset] = links
+        self.write({'offset': offset, 'links': links})
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        self.close()
+        self.path.unlink()
 
 
 class Scraper():
 
-    def __init__(self, url, features=None):
+    def __init__(self, url, features=None, browser=None, schema=None, name=None, block=None):
         self.url = url + '?' + ungrouped_variants_query
+        self.name = name
+        # Requests blocked while loading pages, the browser's default if not given
+        self.blocker = RequestBlocker.from_dict(block) if block is not None else None
         self.features = features
+        self.schema = schema if schema is not None else {}
+        self.filter = FeatureFilter(features) if features is not None else None
+        self.columns = self.filter.columns if self.filter is not None else None
+        # Share the given browser, or own one for the lifetime of the scraper
+        self.owns_browser = browser is None
+        self.browser = Browser() if browser is None else browser
 
     @classmethod
-    def from_yaml(cls, path):
+    def from_yaml(cls, path, browser=None):
         with open(path, 'r') as file:
             config = yaml.safe_load(file)
-        return cls(config['url'], config['features'])
+        return cls(config['url'], config['features'], browser, config.get('schema'), Path(path).stem, config.get('block'))
 
-    def scrape(self, max_products=float('inf')):
-        num_products = get_number_of_products(self.url)
-        num_products = int(min(num_products, max_products))
+    def close(self):
+        if self.owns_browser:
+            self.browser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_previous_product(self, product_node):
+        # Reuse the previously scraped product if its listed price did not change
+        if self.previous_products is None or product_node is None:
+            return None
+        previous_product = self.previous_products.get(get_product_link(product_node))
+        if previous_product is not None and previous_product['price'] == get_product_listing_price(product_node):
+            return previous_product
+        return None
+
+    def get_journaled_product(self, link):
+        # Product completed by a previous run, if resuming, with whether it was completed
+        if self.journal is not None and link in self.journal.products:
+            self.stats['resumed'] += 1
+            return True, self.journal.products[link]
+        if self.journal is not None and link in self.journal.discarded:
+            self.stats['discarded'] += 1
+            return True, None
+        return False, None
+
+    def add_product(self, link, product):
+        # Incomplete products are discarded, failed products are not recorded, to be retried
+        if product is None:
+            self.stats['discarded'] += 1
+        if self.journal is not None:
+            if product is None:
+                self.journal.add_discarded(link)
+            else:
+                self.journal.add_product(link, product)
+        return product
+
+    def add_failed(self, link, error):
+        print(f'Failed to scrape {link}: {error}')
+        METRICS.count('failed', type(error).__name__)
+        self.failed.append(link)
+
+    def add_listing(self, link, product_node):
+        # Offers of single merchants in the search results link to the merchant, they are kept
+        # for the product listed with the same title instead of being discarded. Both are journaled,
+        # as the search pages of a previous run only give the links
+        key = get_listing_key(product_node)
+        if key is None:
+            return
+        if is_product_url(link):
+            # Listings with the same title may still be different products, they are only merged once scraped
+            if key not in self.listing_links:
+                self.listing_links[key] = link
+                if self.journal is not None:
+                    self.journal.add_listing(key, link)
+        else:
+            offer = parse_offer(product_node)
+            if offer is not None:
+                self.listed_offers[link] = (key, offer)
+                if self.journal is not None:
+                    self.journal.add_listing_offer(link, key, offer)
+
+    def add_listing_offer(self, link):
+        if link not in self.listed_offers:
+            return False
+        key, offer = self.listed_offers[link]
+        self.listing_offers.append((key, link, offer))
+        return True
+
+    def add_listing_offers(self):
+        for key, link, offer in self.listing_offers:
+            product_link = self.index.canonical.get(self.listing_links.get(key))
+            if product_link is None:
+                discard_external_url(link)
+                self.add_product(link, None)
+            else:
+                self.add_offers(product_link, [offer])
+
+    def scrape_product(self, link, product_node):
+        if self.add_listing_offer(link):
+            return None
+        completed, product = self.get_journaled_product(link)
+        if completed:
+            return product
+        product = self.get_previous_product(product_node)
+        if product is not None:
+            self.stats['reused'] += 1
+            return self.add_product(link, product)
+        try:
+            return self.add_product(link, get_product_features(link, self.filter, self.browser, self.blocker))
+        except Exception as e:
+            self.add_failed(link, e)
+
+    async def scrape_product_async(self, link, product_node, browser):
+        if self.add_listing_offer(link):
+            return None
+        completed, product = self.get_journaled_product(link)
+        if completed:
+            return product
+        product = self.get_previous_product(product_node)
+        if product is not None:
+            self.stats['reused'] += 1
+            return self.add_product(link, product)
+        try:
+            return self.add_product(link, await get_product_features_async(link, self.filter, browser, self.blocker))
+        except Exception as e:
+            self.add_failed(link, e)
+
+    def get_first_search_page(self):
+        # Hit count and products of the first search page, the hit count is journaled to resume without it
+        if self.journal is not None and 0 in self.journal.pages and self.journal.hits is not None:
+            return self.journal.hits, [(link, None) for link in self.journal.pages[0]]
+        url = self.url + '&sfh=o~0'
+        num_products, product_list = retry(lambda: parse_search_page(scrape_website(url, self.browser, self.blocker)), url)
+        page = [(get_product_link(product_node), product_node) for product_node in product_list]
+        if self.journal is not None:
+            self.journal.add_hits(num_products)
+        return num_products, page
+
+    async def get_first_search_page_async(self, browser):
+        if self.journal is not None and 0 in self.journal.pages and self.journal.hits is not None:
+            return self.journal.hits, [(link, None) for link in self.journal.pages[0]]
+        url = self.url + '&sfh=o~0'
+
+        async def get():
+            return parse_search_page(await scrape_website_async(url, browser, self.blocker))
+        num_products, product_list = await retry_async(get, url)
+        page = [(get_product_link(product_node), product_node) for product_node in product_list]
+        if self.journal is not None:
+            self.journal.add_hits(num_products)
+        return num_products, page
+
+    def get_search_page(self, offset):
+        # Links and nodes of the products in a search page, only links if completed by a previous run
+        if self.journal is not None and offset in self.journal.pages:
+            return [(link, None) for link in self.journal.pages[offset]]
+        url = self.url + f'&sfh=o~{offset}'
+        product_list = retry(lambda: get_product_list(url, self.browser, self.blocker), url)
+        return [(get_product_link(product_node), product_node) for product_node in product_list]
+
+    async def get_search_page_async(self, offset, browser):
+        if self.journal is not None and offset in self.journal.pages:
+            return [(link, None) for link in self.journal.pages[offset]]
+        url = self.url + f'&sfh=o~{offset}'
+
+        async def get():
+            return parse_product_list(await scrape_website_async(url, browser, self.blocker))
+        product_list = await retry_async(get, url)
+        return [(get_product_link(product_node), product_node) for product_node in product_list]
+
+    def add_search_page(self, offset, page):
+        if self.journal is not None and offset not in self.journal.pages:
+            self.journal.add_page(offset, [link for link, _ in page])
+
+    def start(self, previous=None, journal=None, resume=False, sinks=(), offer_sinks=()):
+        # Label the metrics recorded while scraping, per task if scraping concurrently
+        current_category.set(self.name)
+
+        # Stream products and offers to the given sinks as they are scraped, else collect them
+        self.sinks = list(sinks)
+        self.offer_sinks = list(offer_sinks)
+        self.results = []
+        self.pending = {}
+        self.next_position = 0
+        self.offers = []
+        self.merchants = set()
+        self.count = 0
 
+        # Merge listings of the same product, by name and features, and keep the first link listed with
+        # every title, to add the offers of merchants listed with the same title
+        self.index = ProductIndex()
+        self.listing_links = {}
+        self.listed_offers = {}
+        self.listing_offers = []
+
+        # Only scrape new products or products with a changed price, if previous results are given
+        self.previous_products = load_previous_products(previous) if previous is not None else None
+        if previous is not None:
+            for link, offers in load_previous_offers(previous).items():
+                if link in self.previous_products:
+                    self.previous_products[link]['offers'] = offers
+
+        # Record completed products and search pages, to resume from them if the run is interrupted
+        self.journal = Journal(journal, resume) if journal is not None else None
+        self.resume = resume
+        if self.journal is not None:
+            self.listing_links.update(self.journal.listings)
+            self.listed_offers.update(self.journal.listing_offers)
+        self.stats = dict(reused=0, resumed=0, discarded=0, duplicates=0, merged=0)
+        self.failed = []
+
+    def finish(self, log=True):
+        if log:
+            if self.previous_products is not None:
+                print(f"Reused {self.stats['reused']} unchanged products")
+            if self.journal is not None and self.resume:
+                print(f"Resumed {self.stats['resumed']} products from the journal")
+            if self.stats['duplicates']:
+                print(f"Skipped {self.stats['duplicates']} products listed more than once")
+            if self.stats['merged']:
+                print(f"Merged {self.stats['merged']} listings of the same products")
+            print(f"Discarded {self.stats['discarded']} incomplete products")
+            if self.failed:
+                print(f"Failed to scrape {len(self.failed)} products, "
+                      f"{'resume to retry them' if self.journal is not None else 'rerun to retry them'}")
+        if self.journal is not None and not self.failed:
+            # Nothing left to resume
+            self.journal.remove()
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def add_offers(self, link, offers):
+        # One offer per merchant and product, the first one listed, as the offers of previously scraped
+        # products include those merged from other listings
+        for offer in offers:
+            if (link, offer['merchant']) in self.merchants:
+                continue
+            self.merchants.add((link, offer['merchant']))
+            row = {'link': link, **offer}
+            if self.offer_sinks:
+                for sink in self.offer_sinks:
+                    sink.write(row)
+            else:
+                self.offers.append(row)
+
+    def add_result(self, position, product):
+        # Results are released in the order of the search results, also when scraped concurrently,
+        # once the products at all previous positions were scraped, discarded or skipped
+        self.pending[position] = product
+        while self.next_position in self.pending:
+            self.release_result(self.pending.pop(self.next_position))
+            self.next_position += 1
+
+    def flush_results(self):
+        # Positions missing from the search pages, e.g. if the results changed while scraping, hold back
+        # the following results until the end
+        for position in sorted(self.pending):
+            self.release_result(self.pending.pop(position))
+
+    def release_result(self, product):
+        if product is None:
+            return
+
+        # Offers of another listing of an already scraped product are added to that product
+        offers = product.pop('offers', [])
+        link = self.index.add(product)
+        self.add_offers(link, offers)
+        if link != product.get('link'):
+            self.stats['merged'] += 1
+            return
+
+        # Products are written as they are released, or returned
+        self.count += 1
+        if self.sinks:
+            for sink in self.sinks:
+                sink.write(product)
+        else:
+            self.results.append(product)
+
+    def scrape(self, max_products=float('inf'), concurrency=1, rate_limit=4, previous=None, journal=None, resume=False,
+               sinks=(), offer_sinks=()):
+        # Fetch product pages concurrently through the async API if requested
+        if concurrency > 1:
+            return asyncio.run(self.scrape_async(max_products, concurrency, rate_limit, previous, journal, resume, sinks,
+                                                 offer_sinks))
+
+        self.start(previous, journal, resume, sinks, offer_sinks)
+        try:
+            self.scrape_sync(max_products)
+            self.flush_results()
+            self.add_listing_offers()
+        finally:
+            self.close_journal()
+        self.products = self.results
+        self.finish()
+        return self.products
+
+    async def scrape_async(self, max_products=float('inf'), concurrency=8, rate_limit=4, previous=None, journal=None,
+                           resume=False, sinks=(), offer_sinks=(), browser=None, position=None, log=True):
+        # Share the given async browser, e.g. with the scrapers of other categories, or own one
+        if browser is None:
+            async with AsyncBrowser.from_fetcher(self.browser, concurrency, rate_limit) as browser:
+                return await self.scrape_async(max_products, previous=previous, journal=journal, resume=resume,
+                                               sinks=sinks, offer_sinks=offer_sinks, browser=browser, position=position,
+                                               log=log)
+
+        self.start(previous, journal, resume, sinks, offer_sinks)
+        try:
+            await self.scrape_pages_async(browser, max_products, position)
+            self.flush_results()
+            self.add_listing_offers()
+        finally:
+            self.close_journal()
+        self.products = self.results
+        self.finish(log)
+        return self.products
+
+    def page_offsets(self, page_size, num_products):
+        # Offsets of the search pages following the first one, which gives the page size
+        return range(page_size, num_products, page_size) if page_size > 0 else range(0)
+
+    def list_products(self, offset, page, num_products, seen):
+        # Products of a search page with their position in the results, up to the maximum
+        # number of products, skipping products listed by other pages
+        listed = page[:max(num_products - offset, 0)]
         products = []
-        remaining_products = num_products
-        discarded_products = 0
+        for position, (link, product_node) in enumerate(listed, offset):
+            if link in seen:
+                self.add_result(position, None)
+                continue
+            seen.add(link)
+            if product_node is not None:
+                self.add_listing(link, product_node)
+            products.append((position, link, product_node))
+        self.stats['duplicates'] += len(listed) - len(products)
+        # Journal the page last, once the listings it gives are journaled
+        self.add_search_page(offset, page)
+        return products
+
+    def scrape_sync(self, max_products=float('inf')):
+        # The first search page gives the hit count
+        num_products, first_page = self.get_first_search_page()
+        num_products = int(min(num_products, max_products))
+
+        # List all products first, from the search pages at the offsets following from the hit count
+        seen = set()
+        queue = self.list_products(0, first_page, num_products, seen)
+        for offset in self.page_offsets(len(first_page), num_products):
+            queue += self.list_products(offset, self.get_search_page(offset), num_products, seen)
 
         # Create progress bar
-        with tqdm(total=num_products, desc="Scraping Products") as pbar:
+        with tqdm(total=len(queue), desc=self.name or "Scraping Products") as pbar:
 
-            # Iterate search pages until we went through all products
-            while remaining_products > 0:
+            # Iterate listed products
+            for index, link, product_node in queue:
+                product = self.scrape_product(link, product_node)
 
-                # Get links to all products in search page
-                product_list = get_product_list(self.url + f'&sfh=o~{len(products)}')
-                product_links = [get_product_link(product) for product in product_list]
+                # No product is returned if it was discarded or failed
+                self.add_result(index, product)
+                pbar.update(1)
 
-                # Iterate products in page
-                for link in product_links:
+    async def scrape_pages_async(self, browser, max_products=float('inf'), position=None):
+        # The first search page gives the hit count, the other pages are fetched concurrently
+        num_products, first_page = await self.get_first_search_page_async(browser)
+        num_products = int(min(num_products, max_products))
+
+        async def get_search_page(offset):
+            return offset, await self.get_search_page_async(offset, browser)
 
-                    # Break when we processed maximum number of products
-                    if remaining_products > 0:
+        # Products are scraped from a queue as soon as they are listed, in any order
+        seen = set()
+        queue = asyncio.Queue()
 
-                        product = get_product_features(link, self.features)
+        # Create progress bar, one per scraper if several share the browser
+        with tqdm(total=num_products, desc=self.name or "Scraping Products", position=position) as pbar:
 
-                        # Check if a valid product was returned, else count it as discarded
-                        if product is not None:
-                            products.append(product)
-                        else:
-                            discarded_products += 1
+            def queue_products(offset, page):
+                listed = self.list_products(offset, page, num_products, seen)
+                for product in listed:
+                    queue.put_nowait(product)
+                # Products listed by several pages are only scraped once
+                pbar.total -= min(len(page), max(num_products - offset, 0)) - len(listed)
+                pbar.refresh()
 
-                        remaining_products -= 1
-                        pbar.update(1)
+            async def list_all_products():
+                # Fetch all search pages concurrently, once the first one gave the page size
+                try:
+                    queue_products(0, first_page)
+                    search_pages = [get_search_page(offset) for offset in self.page_offsets(len(first_page), num_products)]
+                    for search_page in asyncio.as_completed(search_pages):
+                        queue_products(*await search_page)
+                finally:
+                    # Stop the workers once the queue is drained
+                    for _ in range(browser.concurrency):
+                        queue.put_nowait(None)
 
-                    else:
+            async def scrape_products():
+                while True:
+                    item = await queue.get()
+                    if item is None:
                         break
+                    index, link, product_node = item
+                    product = await self.scrape_product_async(link, product_node, browser)
 
-        print(f"Discarded {discarded_products} products")
-        self.products = products
-        return self.products
+                    # No product is returned if it was discarded or failed
+                    self.add_result(index, product)
+                    pbar.update(1)
+
+            # Raise errors listing products only once the products listed so far are scraped
+            listing = asyncio.ensure_future(list_all_products())
+            await asyncio.gather(*[scrape_products() for _ in range(browser.concurrency)])
+            await listing
 
     def to_csv(self, path):
         df = pd.DataFrame(self.products)
         df.to_csv(path, index=False)
 
+    def offers_to_csv(self, path):
+        pd.DataFrame(self.offers, columns=OFFER_COLUMNS).to_csv(path, index=False)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Scrape a Toppreise results webpage')
@@ -177,10 +1394,18 @@ if __name__ == "__main__":
     parser.add_argument('features', type=str, nargs='+', help='Features to scrape')
     parser.add_argument('--max-products', type=int, default=float('inf'), help='Maximum number of products to scrape')
     parser.add_argument('--output', type=str, default='output.csv', help='Output file path')
+    parser.add_argument('--concurrency', type=int, default=1, help='Number of product pages to fetch concurrently')
+    parser.add_argument('--rate-limit', type=float, default=4, help='Maximum number of requests per second to the same host')
+    parser.add_argument('--http', action='store_true', help='Fetch pages over plain HTTP, falling back to the browser')
     args = parser.parse_args()
-    scraper = Scraper(args.url, args.features)
-    scraper.scrape(args.max_products)
-    scraper.to_csv(args.output)
+    # The synchronous browser is started on first use, it cannot run alongside the async one
+    browser = HttpClient(fallback=Browser()) if args.http else Browser()
+    try:
+        with Scraper(args.url, args.features, browser) as scraper, CSVSink(args.output, scraper.columns) as sink, \
+                CSVSink(offers_path(args.output), OFFER_COLUMNS) as offer_sink:
+            scraper.scrape(args.max_products, args.concurrency, args.rate_limit, sinks=[sink], offer_sinks=[offer_sink])
+    finally:
+        browser.close()
     # # To just scrape a product page
     # scraper = Scraper.from_yaml('spec/case.yaml')
     # get_product_features(args.url, scraper.features)
@@ -0,0 +1,75 @@
+import re
+import pandas as pd
+
+# Default patterns, capturing a value and its unit
+count_regex = re.compile(r'^(\d+)x$')
+size_regex = re.compile(r'^(\d*\.?\d+)\s*([kMGT]B)$', re.IGNORECASE)
+cache_size_regex = re.compile(r'^(\d+)x\s*(\d*\.?\d+)\s*([kMGT]B)$', re.IGNORECASE)
+frequency_regex = re.compile(r'^(\d*\.?\d+)\s*([kMG]Hz)$', re.IGNORECASE)
+power_regex = re.compile(r'^(\d*\.?\d+)\s*(k?W)$')
+noise_level_regex = re.compile(r'^(\d*\.?\d+)\s*(dBA)$')
+rotations_regex = re.compile(r'^(\d+)\s*(rpm)$')
+
+# Unit conversion tables, relative to the smallest unit, keyed by lowercase unit
+size_units = {'kb': 1, 'mb': 1024, 'gb': 1024 ** 2, 'tb': 1024 ** 3}
+frequency_units = {'khz': 1, 'mhz': 1000, 'ghz': 1000 ** 2}
+power_units = {'w': 1, 'kw': 1000}
+noise_level_units = {'dba': 1}
+rotations_units = {'rpm': 1}
+
+
+def extract(series, regex, description):
+    # Match all values at once, and report all values which do not match
+    pattern = re.compile(regex) if isinstance(regex, str) else regex
+    groups = series.astype('string').str.extract(pattern)
+    invalid = groups[0].isna()
+    if invalid.any():
+        invalid_values = series[invalid].astype(str).unique()
+        raise ValueError(f"{invalid.sum()} {description} values do not match the required format: "
+                         f"{', '.join(repr(value) for value in invalid_values)}")
+    return groups
+
+
+def scalar(series, regex, description, dtype=float):
+    return extract(series, regex, description)[0].astype(dtype)
+
+
+def quantity(series, regex, description, units, unit, dtype=float):
+    # Convert values to the requested unit, the unit being the last group in the pattern
+    groups = extract(series, regex, description)
+    factors = groups[groups.columns[-1]].str.lower().map(units).astype(float)
+    return (groups[0].astype(float) * factors / units[unit.lower()]).astype(dtype)
+
+
+def count(series, regex=count_regex, description='Count'):
+    return scalar(series, regex, description, int)
+
+
+def size(series, unit='GB', regex=size_regex, description='Size'):
+    return quantity(series, regex, description, size_units, unit)
+
+
+def cache_size(series, unit='kB', regex=cache_size_regex, description='Cache size', missing=None):
+    # Total size of a cache made of several instances, e.g. "2x 1MB"
+    present = series.notna() if missing is not None else pd.Series(True, index=series.index)
+    total = pd.Series(missing, index=series.index, dtype=float)
+    groups = extract(series[present], regex, description)
+    factors = groups[groups.columns[-1]].str.lower().map(size_units).astype(float) / size_units[unit.lower()]
+    total[present] = groups[0].astype(int) * groups[1].astype(float) * factors
+    return total
+
+
+def frequency(series, unit='MHz', regex=frequency_regex, description='Frequency', dtype=float):
+    return quantity(series, regex, description, frequency_units, unit, dtype)
+
+
+def power(series, unit='W', regex=power_regex, description='Power', dtype=float):
+    return quantity(series, regex, description, power_units, unit, dtype)
+
+
+def noise_level(series, regex=noise_level_regex, description='Noise level'):
+    return quantity(series, regex, description, noise_level_units, 'dBA')
+
+
+def rotations(series, regex=rotations_regex, description='Rotations'):
+    return quantity(series, regex, description, rotations_units, 'rpm')
@@ -1,6 +1,74 @@
+from pathlib import Path
+import pandas as pd
+from criteria import Criteria
+
+COMPLETE_DATA_DIR = Path('data/complete')
+FILTERED_DATA_DIR = Path('data/filtered')
+SPECS_DIR = Path('spec')
+
+# Parse function of every product, by name, the filters are described by its spec
+PARSERS = {}
+
+
 def filter_dataframe(df, filter, name=None):
     original_size = df.index.size
     filtered_size = filter.sum()
     num_removed = original_size - filtered_size
     print(f'Removed {num_removed}/{original_size} entries by {name + " " if name else ""}filter.')
     return df[filter]
+
+
+def has_products(name, directory=COMPLETE_DATA_DIR):
+    # Only the files read by read_products count, not the leftovers of interrupted scrapes
+    return (Path(directory) / f'{name}.csv').exists() or (Path(directory) / f'{name}.parquet').exists()
+
+
+def read_products(name, columns=None, directory=COMPLETE_DATA_DIR):
+    # Prefer the typed Parquet file, unless the CSV file was written after it
+    csv_path = Path(directory) / f'{name}.csv'
+    parquet_path = Path(directory) / f'{name}.parquet'
+    if parquet_path.exists() and (not csv_path.exists() or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime):
+        return pd.read_parquet(parquet_path, columns=columns)
+    return pd.read_csv(csv_path, usecols=columns)
+
+
+def read_offers(name, directory=COMPLETE_DATA_DIR):
+    # Offers of every product by merchant, if scraped
+    path = Path(directory) / f'{name}.offers.csv'
+    return pd.read_csv(path) if path.exists() else None
+
+
+def add_best_offers(df, offers):
+    # Price of the cheapest offer in stock, shipping included, instead of the price listed by Toppreise,
+    # which is kept for products without any offer in stock. Offers with unknown shipping costs are
+    # only chosen if no other offer is in stock, their price then excludes shipping
+    if offers is None:
+        return df
+    offers = offers[offers['in stock'].astype(bool)]
+    offers = offers.assign(total=offers['price'] + offers['shipping'].fillna(0), unknown=offers['shipping'].isna())
+    best = offers.sort_values(['unknown', 'total'], kind='stable').drop_duplicates('link').set_index('link')
+    df['listed price'] = df['price']
+    df['price'] = df['link'].map(best['total']).fillna(df['listed price'])
+    df['merchant'] = df['link'].map(best['merchant'])
+    df['in stock'] = df['link'].isin(best.index)
+    df['shipping unknown'] = df['link'].map(best['unknown']).fillna(False).astype(bool)
+    return df
+
+
+def register_parser(name):
+    def register(function):
+        PARSERS[name] = function
+        return function
+    return register
+
+
+def parse_products(name, directory=COMPLETE_DATA_DIR):
+    # Offers are added to the parsed products, before the derived columns of the spec are computed
+    return add_best_offers(PARSERS[name](read_products(name, directory=directory)), read_offers(name, directory))
+
+
+def run_filter(name, input_dir=COMPLETE_DATA_DIR, output_dir=FILTERED_DATA_DIR, criteria=None):
+    criteria = criteria or Criteria.from_yaml(SPECS_DIR / f'{name}.yaml')
+    df = criteria.apply(parse_products(name, input_dir))
+    df.to_csv(Path(output_dir) / f'{name}.csv', index=False)
+    return df